@@ -0,0 +1,133 @@
+import csv
+import numpy as np
+import os
+import sqlite3
+import time
+
+from emoji_table import EmojiTable
+
+TYPES = ("p", "r", "n")  # pragmatic, referential, neither
+
+# labels is append-only: a coder labels a tweet once and the row is kept.
+# counts holds the number of labels containing each type, per language and
+# coder, updated in the same transaction as the label it counts
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS labels (
+    lang TEXT NOT NULL,
+    tweet INTEGER NOT NULL,
+    coder TEXT NOT NULL,
+    types TEXT NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (lang, tweet, coder)
+);
+CREATE TABLE IF NOT EXISTS counts (
+    lang TEXT NOT NULL,
+    coder TEXT NOT NULL,
+    type TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (lang, coder, type)
+);
+"""
+
+
+class AnnotationStore:
+    """
+    Manual type labels of tweets, keyed by (lang, tweet index, coder), in one
+    SQLite file. WAL mode lets several coders append while others read, each
+    label is its own short transaction, and totals come from the counters.
+    """
+
+    def __init__(self, path="annotations.sqlite") -> None:
+        self.path = path
+        # autocommit, transactions are opened explicitly in add()
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.db.close()
+
+    def add(self, lang: str, tweet: int, coder: str, types: str) -> bool:
+        "records one label, returning False if coder already labelled the tweet"
+        with self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            cursor = self.db.execute(
+                "INSERT OR IGNORE INTO labels VALUES (?, ?, ?, ?, ?)",
+                (lang, int(tweet), coder, types, time.time()),
+            )
+            if cursor.rowcount == 0:
+                return False
+            # a label such as "pr" counts once for each character, as before
+            self.db.executemany(
+                "INSERT INTO counts VALUES (?, ?, ?, 1) ON CONFLICT"
+                " (lang, coder, type) DO UPDATE SET count = count + 1",
+                [(lang, coder, char) for char in types],
+            )
+        return True
+
+    def type_counts(self, lang: str, coder=None) -> dict[str, int]:
+        "labels containing each type in lang, by coder or by everyone"
+        query = "SELECT type, SUM(count) FROM counts WHERE lang = ?"
+        args = [lang]
+        if coder is not None:
+            query += " AND coder = ?"
+            args.append(coder)
+        counts = dict.fromkeys(TYPES, 0)
+        counts.update(self.db.execute(query + " GROUP BY type", args).fetchall())
+        return counts
+
+    def labels(self, lang: str, coder=None) -> tuple[np.ndarray, list[str]]:
+        "(tweet indices, label strings) of lang, sorted by tweet index"
+        query = "SELECT tweet, types FROM labels WHERE lang = ?"
+        args = [lang]
+        if coder is not None:
+            query += " AND coder = ?"
+            args.append(coder)
+        rows = self.db.execute(query + " ORDER BY tweet", args).fetchall()
+        tweets = np.array([row[0] for row in rows], dtype=np.int64)
+        return tweets, [row[1] for row in rows]
+
+    def coded(self, lang: str, coder=None) -> set[int]:
+        "tweet indices of lang with a label, from coder or from anyone"
+        return set(self.labels(lang, coder)[0].tolist())
+
+    def import_csvs(self, lang: str, texts_to_index: dict, types_dir="types"):
+        """
+        adds the labels of <types_dir>/<lang>/types_N.csv files as coder
+        "legacy", finding each tweet's index from its text. Rerunning it adds
+        nothing twice. Returns (labels added, rows whose text was not found).
+        """
+        added = missing = 0
+        lang_dir = os.path.join(types_dir, lang)
+        try:
+            files = sorted(os.listdir(lang_dir))
+        except FileNotFoundError:
+            print(f"No coded tweets in {lang_dir}")
+            return added, missing
+        for file in files:
+            if not (file.startswith("types_") and file.endswith(".csv")):
+                continue
+            with open(os.path.join(lang_dir, file), "r", newline="") as f:
+                for row in csv.reader(f):
+                    if not row:
+                        continue
+                    tweet = texts_to_index.get(row[0])
+                    if tweet is None:
+                        missing += 1
+                    elif self.add(lang, tweet, "legacy", row[1]):
+                        added += 1
+        return added, missing
+
+
+def type_matrix(labels: list[str]) -> np.ndarray:
+    "boolean table of label x type, True where the label contains the type"
+    return np.array([[t in label for t in TYPES] for label in labels], dtype=bool)
+
+
+def join_rows(table: EmojiTable, tweets: np.ndarray) -> np.ndarray:
+    "row of table holding each tweet index, -1 for tweets the table lacks"
+    rows = np.searchsorted(table.indices, tweets)
+    found = rows < len(table.indices)
+    found[found] = table.indices[rows[found]] == tweets[found]
+    return np.where(found, rows, -1)
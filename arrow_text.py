@@ -0,0 +1,68 @@
+import json
+import numpy as np
+import os
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from emoji_trends import MISSING_DAY
+
+
+def read_table(path: str) -> pa.Table:
+    "every column of a save_to_disk directory, memory-mapped"
+    with open(os.path.join(path, "state.json"), "r", encoding="utf-8") as f:
+        files = [entry["filename"] for entry in json.load(f)["_data_files"]]
+    # save_to_disk writes Arrow IPC streams; reading them from a memory map
+    # gives buffers that point into the file rather than copies of it
+    tables = [
+        pa.ipc.open_stream(pa.memory_map(os.path.join(path, file))).read_all()
+        for file in files
+    ]
+    return pa.concat_tables(tables)
+
+
+def to_date32(column):
+    """
+    dates, timestamps or strings starting with an ISO date as Arrow date32
+    (days since 1970 in 4 bytes), null where a string does not parse
+    """
+    if pa.types.is_date32(column.type):
+        return column
+    if pa.types.is_timestamp(column.type) or pa.types.is_date64(column.type):
+        return pc.cast(column, pa.date32())
+    day = pc.utf8_slice_codeunits(column, 0, 10)
+    parsed = pc.strptime(day, format="%Y-%m-%d", unit="s", error_is_null=True)
+    return pc.cast(parsed, pa.date32())
+
+
+def read_days(path: str, column="date") -> np.ndarray | None:
+    "days since 1970 of every row as int32, None if the dataset has no dates"
+    table = read_table(path)
+    if column not in table.column_names:
+        return None
+    days = pc.cast(to_date32(table.column(column)), pa.int32())
+    return days.fill_null(MISSING_DAY).to_numpy()
+
+
+class ArrowText:
+    """
+    Text column of a save_to_disk directory, memory-mapped straight from its
+    Arrow files so opening it reads no text and does not import datasets.
+    Indexing matches a numpy-formatted datasets column: an int gives one
+    tweet, a slice or a list of ints gives a numpy array of them.
+    """
+
+    def __init__(self, path: str, column="text") -> None:
+        self.column = read_table(path).column(column)
+
+    def __len__(self) -> int:
+        return len(self.column)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self.column))
+            if step != 1:
+                return self[list(range(start, stop, step))]
+            return np.array(self.column.slice(start, stop - start).to_pylist())
+        if isinstance(key, (list, np.ndarray)):
+            return np.array(self.column.take(pa.array(key, pa.int64())).to_pylist())
+        return self.column[int(key)].as_py()
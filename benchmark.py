@@ -0,0 +1,326 @@
+import report  # first, so matplotlib uses Agg before process_data imports pyplot
+
+import argparse
+import emoji
+import hashlib
+import json
+import numpy as np
+import os
+import shutil
+import sys
+import time
+
+import matplotlib.pyplot as plt
+
+import emoji_cache
+import instrument
+from process_data import Data
+
+WORDS = {
+    "en": "the a and to of you my is it this for love so just me not day good".split(),
+    "it": "il la e di che non un per una sono mi ti ciao grazie bene come oggi".split(),
+    "es": "el la de que y en los se por un con no una su para es hola gracias".split(),
+}
+SPECIFIC = ["👍", "❤️", "🤌"]
+
+
+def emoji_pools() -> dict[str, list[str]]:
+    "emoji of the emoji package split into plain, ZWJ and skin-toned ones"
+    pools = {"plain": [], "zwj": [], "skin": []}
+    for e in emoji.EMOJI_DATA:
+        if any("\U0001f3fb" <= c <= "\U0001f3ff" for c in e):
+            pools["skin"].append(e)
+        elif "\u200d" in e:
+            pools["zwj"].append(e)
+        else:
+            pools["plain"].append(e)
+    for pool in pools.values():
+        pool.sort()
+    return pools
+
+
+def generate(lang: str, rows: int, density: float, zwj: float, skin: float, seed):
+    """
+    rows synthetic tweets of 3 to 20 tokens. Each token is an emoji with
+    probability density, drawn ZWJ with probability zwj, skin-toned with
+    probability skin and otherwise from a Zipf distribution over plain emoji.
+    About a fifth of the tweets have no spaces, like the ones the tokenizer has
+    to split without help.
+    """
+    rng = np.random.default_rng(seed)
+    pools = emoji_pools()
+    words = WORDS.get(lang, WORDS["en"])
+    plain = pools["plain"]
+    zipf = 1 / np.arange(1, len(plain) + 1)
+    zipf /= zipf.sum()
+    lengths = rng.integers(3, 21, rows)
+    total = int(lengths.sum())
+    kinds = rng.random(total)
+    choice = rng.random(total)
+    tokens = np.array(words, dtype=object)[rng.integers(len(words), size=total)]
+    is_emoji = kinds < density
+    k = int(is_emoji.sum())
+    picks = np.array(plain, dtype=object)[rng.choice(len(plain), size=k, p=zipf)]
+    picks[choice[is_emoji] < zwj] = np.array(pools["zwj"], dtype=object)[
+        rng.integers(len(pools["zwj"]), size=int((choice[is_emoji] < zwj).sum()))
+    ]
+    toned = (choice[is_emoji] >= zwj) & (choice[is_emoji] < zwj + skin)
+    picks[toned] = np.array(pools["skin"], dtype=object)[
+        rng.integers(len(pools["skin"]), size=int(toned.sum()))
+    ]
+    tokens[is_emoji] = picks
+    joiners = np.where(rng.random(rows) < 0.2, "", " ")
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).tolist()
+    texts = [joiners[i].join(tokens[offsets[i] : offsets[i + 1]]) for i in range(rows)]
+    dates = [f"2019-{m:02d}-01" for m in rng.integers(1, 13, rows).tolist()]
+    return texts, dates
+
+
+def make_corpus(work: str, langs, rows: int, density, zwj, skin, seed) -> str:
+    """
+    writes a dataset per language and a registry for them under work, reusing
+    them when a corpus of the same parameters is already there
+    """
+    from datasets import Dataset
+
+    params = [langs, rows, density, zwj, skin, seed]
+    key = hashlib.sha256(json.dumps(params).encode()).hexdigest()[:16]
+    corpus = os.path.join(work, f"corpus-{key}")
+    registry_file = os.path.join(corpus, "registry.json")
+    if not os.path.exists(registry_file):
+        print(f"Generating {rows} tweets in each of {', '.join(langs)}")
+        registry = {}
+        for i, lang in enumerate(langs):
+            texts, dates = generate(lang, rows, density, zwj, skin, [seed, i])
+            path = os.path.join(corpus, f"{lang}_data")
+            Dataset.from_dict({"text": texts, "date": dates}).save_to_disk(path)
+            registry[lang] = {
+                "label": lang,
+                "color": None,
+                "path": f"{lang}_data",
+                "rows": rows,
+                "spec": key,
+            }
+        emoji_cache.write_json(registry_file, registry)
+    return registry_file
+
+
+def measure(function, repeat=1, items=None) -> tuple[dict, object]:
+    "best time of repeat calls of function, with peak RSS and items per second"
+    times = []
+    instrument.reset_peak()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+        plt.close("all")
+    stats = {"seconds": min(times), "peak_rss": instrument.peak_rss()}
+    if items is not None:
+        stats["per_second"] = items / max(stats["seconds"], 1e-9)
+    return stats, result
+
+
+class _NoPlots:
+    "stops Data's plotting methods from writing or showing their figures"
+
+    def __enter__(self):
+        self.saved = plt.savefig, plt.show
+        plt.savefig = plt.show = lambda *args, **kwargs: None
+
+    def __exit__(self, *exc):
+        plt.savefig, plt.show = self.saved
+        plt.close("all")
+
+
+def _forget_derived(data: Data) -> None:
+    "drops co-occurrence kept in memory or on disk, so it is timed every call"
+    data.lang_cooc.clear()
+    for lang in data.langs:
+        path = os.path.join(data.cache_dir, lang, "cooc.npz")
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _remove_csvs(langs) -> None:
+    "deletes <lang>_emoji.csv, which Data would migrate instead of extracting"
+    for lang in langs:
+        if os.path.exists(f"{lang}_emoji.csv"):
+            os.remove(f"{lang}_emoji.csv")
+
+
+def metric_calls(data: Data, k: int) -> dict:
+    "every analysis method of Data, by name, as a call taking no arguments"
+    first = data.langs[0]
+    return {
+        "percent_with_emoji": data.percent_with_emoji,
+        "top_emoji": lambda: data.top_emoji(k),
+        "emoji_per_character": data.emoji_per_character,
+        "type_token_analysis": data.type_token_analysis,
+        "handshape_emoji": data.handshape_emoji,
+        "category_table": data.category_table,
+        "specific_emoji_counts": lambda: data.specific_emoji_counts(SPECIFIC),
+        "plot_multiple_specific": lambda: data.plot_multiple_specific(SPECIFIC),
+        "get_most_different": lambda: data.get_most_different(k),
+        "difference_table": data.difference_table,
+        "cooccurrence": lambda: [data.cooccurrence(lang) for lang in data.langs],
+        "least_shared_neighbors": lambda: data.least_shared_neighbors(k, k),
+        "sample": lambda: data.sampler(first, seed=0, exclude_coded=False).sample(1000),
+    }
+
+
+def run(args) -> dict:
+    "times every stage on the corpus described by args, inside args.work"
+    os.makedirs(args.work, exist_ok=True)
+    # the category CSVs are read from the working directory
+    for file in ("handshape_emoji.csv",):
+        source = os.path.join(os.path.dirname(os.path.abspath(__file__)), file)
+        shutil.copy(source, os.path.join(args.work, file))
+    os.chdir(args.work)
+    registry = make_corpus(
+        ".", args.langs, args.rows, args.density, args.zwj, args.skin, args.seed
+    )
+
+    Data.size = args.rows
+    Data.registry = registry
+    Data.cache_dir = "cache"
+    Data.graph_dir = "graphs"
+    Data.annotations = "annotations.sqlite"
+    # every analysis is timed computing, stored results are timed on their own
+    Data.results_dir = None
+    os.makedirs("graphs", exist_ok=True)
+    items = args.rows * len(args.langs)
+
+    stages = {}
+    shutil.rmtree("cache", ignore_errors=True)
+    _remove_csvs(args.langs)
+    stages["cold_extraction"], data = measure(
+        lambda: Data(workers=args.workers), items=items
+    )
+    stages["warm_load"], data = measure(
+        lambda: Data(workers=args.workers), args.repeat, items
+    )
+    stages["lazy_load"], _ = measure(lambda: Data(lazy=True), args.repeat, items)
+
+    for lang in data.langs:
+        data.write_to_csv(lang)
+    stages["read_from_csv"], _ = measure(
+        lambda: [data.read_from_csv(lang) for lang in data.langs], args.repeat, items
+    )
+    _remove_csvs(data.langs)
+
+    with _NoPlots():
+        for name, call in metric_calls(data, args.k).items():
+            if args.metrics and name not in args.metrics:
+                continue
+            stages[name], _ = measure(
+                lambda: (_forget_derived(data), call()), args.repeat, items
+            )
+            print(f"{name}: {stages[name]['seconds']:.3f}s")
+
+    def metrics():
+        return report.compute_metrics(data, report.METRICS, args.k, SPECIFIC)
+
+    stages["compute_metrics"], results = measure(metrics, args.repeat, items)
+    Data.results_dir = "results"
+    shutil.rmtree("results", ignore_errors=True)
+    stages["compute_metrics_stored"], _ = measure(metrics, args.repeat + 1, items)
+    Data.results_dir = None
+
+    return {
+        "corpus": {
+            "langs": args.langs,
+            "rows": args.rows,
+            "density": args.density,
+            "zwj": args.zwj,
+            "skin": args.skin,
+            "seed": args.seed,
+        },
+        "workers": args.workers,
+        "repeat": args.repeat,
+        "stages": stages,
+        "results": results,
+    }
+
+
+def _same(a, b, rtol=1e-9) -> bool:
+    "whether two JSON values are equal, floats up to rtol"
+    if isinstance(a, float) or isinstance(b, float):
+        return (
+            isinstance(a, (int, float))
+            and isinstance(b, (int, float))
+            and abs(a - b) <= rtol * max(abs(a), abs(b), 1e-300)
+        )
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(_same(a[k], b[k], rtol) for k in a)
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(_same(x, y, rtol) for x, y in zip(a, b))
+    return a == b
+
+
+def compare(current: dict, baseline: dict, tolerance=0.25, floor=0.05) -> list[str]:
+    """
+    regressions of current against baseline: stages more than tolerance
+    slower and at least floor seconds slower, peak RSS more than tolerance
+    higher, and results that changed. Stages missing from either are skipped
+    """
+    problems = []
+    if current["corpus"] != baseline["corpus"]:
+        print("Warning: the baseline was run on a different corpus")
+    for name, now in current["stages"].items():
+        before = baseline["stages"].get(name)
+        if before is None:
+            continue
+        seconds, base = now["seconds"], before["seconds"]
+        if seconds > base * (1 + tolerance) and seconds - base > floor:
+            problems.append(f"{name}: {seconds:.3f}s, baseline {base:.3f}s")
+        if now["peak_rss"] > before["peak_rss"] * (1 + tolerance):
+            problems.append(
+                f"{name}: peak RSS {now['peak_rss'] / 2**20:.0f}MB,"
+                f" baseline {before['peak_rss'] / 2**20:.0f}MB"
+            )
+    if current["corpus"] == baseline["corpus"] and not _same(
+        current["results"], baseline["results"]
+    ):
+        problems.append("results differ from the baseline")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time extraction, cache loads and every analysis of Data "
+        "on a synthetic corpus"
+    )
+    parser.add_argument("--rows", type=int, default=50000, help="tweets per language")
+    parser.add_argument("--langs", nargs="+", default=["en", "it"])
+    parser.add_argument("--density", type=float, default=0.08, help="emoji per token")
+    parser.add_argument("--zwj", type=float, default=0.05, help="share of ZWJ emoji")
+    parser.add_argument("--skin", type=float, default=0.1, help="share skin-toned")
+    parser.add_argument("--seed", type=int, default=497)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3, help="best of, after cold")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--metrics", nargs="*", help="only these analyses")
+    parser.add_argument("--work", default="bench", help="corpus and cache directory")
+    parser.add_argument("--out", default="benchmark.json")
+    parser.add_argument("--baseline", help="fail on regressions against this file")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    out = os.path.abspath(args.out)
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    results = run(args)
+    emoji_cache.write_json(out, results)
+    print(f"Wrote {out}")
+
+    if baseline:
+        with open(baseline, "r", encoding="utf-8") as f:
+            problems = compare(results, json.load(f), args.tolerance)
+        for problem in problems:
+            print("REGRESSION", problem)
+        if problems:
+            sys.exit(1)
+        print(f"No regressions against {baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+import emoji
+import hashlib
+import json
+import numpy as np
+import os
+
+# bump when the layout of the cache changes, older caches are then rebuilt
+CACHE_VERSION = 2
+SAMPLE_ROWS = 64
+VOCAB_FILE = "vocab.json"
+ARRAYS = {
+    "ids": np.int32,
+    "offsets": np.int64,
+    "indices": np.int32,
+    "postings": np.int32,
+    "postings_offsets": np.int64,
+}
+REQUIRED = ("ids", "offsets", "indices")
+
+# Layout of a cache directory:
+#   vocab.json                   emoji codebook shared by every language, append-only
+#   <lang>/ids.npy               codebook id of every extracted emoji, flattened
+#   <lang>/offsets.npy           emoji of tweet k are ids[offsets[k]:offsets[k + 1]]
+#   <lang>/indices.npy           index of each tweet in the source dataset
+#   <lang>/postings.npy          tweet indices grouped by emoji id, ascending
+#   <lang>/postings_offsets.npy  tweets with id e are postings[po[e]:po[e + 1]]
+#   <lang>/part_<start>.npz      ids/offsets/indices of rows checkpointed since the
+#                                arrays above were written, merged in on completion
+#   <lang>/meta.json             version, codebook size, the ranges of source rows
+#                                covered, the fingerprint of the first range and
+#                                a fingerprint of the rows of each part
+#   <lang>/<name>.npz            results derived from the arrays above, such as the
+#                                co-occurrence matrix, valid while meta.json matches
+
+
+def _sample(texts, start: int, stop: int) -> list:
+    "text of SAMPLE_ROWS evenly spaced rows in [start, stop), gathered in one read"
+    n = stop - start
+    if n <= 0:
+        return []
+    rows = np.linspace(start, stop - 1, min(n, SAMPLE_ROWS), dtype=np.int64).tolist()
+    if isinstance(texts, list):
+        return [texts[i] for i in rows]
+    # a dataset column answers a list of rows far faster than one row at a time
+    return list(texts[rows])
+
+
+def fingerprint(texts, size: int, start=0) -> str:
+    "hashes the number of rows used and an evenly spaced sample of their text"
+    # only rows < size are read, so appending rows keeps the fingerprint of a prefix
+    n = min(len(texts), size) - start
+    digest = hashlib.sha1(str(n).encode())
+    for text in _sample(texts, start, start + n):
+        digest.update(str(text).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def vocab_hash(vocab: list[str]) -> str:
+    return hashlib.sha1("\n".join(vocab).encode("utf-8")).hexdigest()
+
+
+def load_vocab(cache_dir: str) -> list[str]:
+    "reads the shared emoji codebook, empty if there is none yet"
+    try:
+        with open(os.path.join(cache_dir, VOCAB_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+def write_json(path: str, obj) -> None:
+    "writes obj to path atomically so an interrupted run never leaves half a file"
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _save_array(path: str, array: np.ndarray) -> None:
+    tmp = path + ".tmp.npy"
+    np.save(tmp, array)
+    os.replace(tmp, path)
+
+
+def _part_path(lang_dir: str, start: int) -> str:
+    return os.path.join(lang_dir, f"part_{start:012d}.npz")
+
+
+def _read_meta(lang_dir: str) -> dict | None:
+    try:
+        with open(os.path.join(lang_dir, "meta.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_meta(
+    lang_dir: str, vocab: list[str], source: str, ranges: list, parts=()
+) -> None:
+    "source fingerprints the first range, each of parts the rows of one more range"
+    write_json(
+        os.path.join(lang_dir, "meta.json"),
+        {
+            "version": CACHE_VERSION,
+            "source": source,
+            "emoji_version": emoji.__version__,
+            "vocab_size": len(vocab),
+            "vocab_hash": vocab_hash(vocab),
+            "rows": ranges[-1][1] if ranges else 0,
+            "ranges": ranges,
+            "parts": list(parts),
+        },
+    )
+
+
+def write_cache(
+    cache_dir: str, lang: str, vocab: list[str], arrays: dict, source: str, rows: int
+) -> None:
+    "writes the named arrays of lang covering source rows [0, rows), dropping parts"
+    lang_dir = os.path.join(cache_dir, lang)
+    os.makedirs(lang_dir, exist_ok=True)
+    # drop the old meta.json first so a half-written cache is never read as valid
+    meta = _read_meta(lang_dir)
+    if meta is not None:
+        os.remove(os.path.join(lang_dir, "meta.json"))
+        for start, _ in meta.get("ranges", [])[1:]:
+            if os.path.exists(_part_path(lang_dir, start)):
+                os.remove(_part_path(lang_dir, start))
+    write_json(os.path.join(cache_dir, VOCAB_FILE), vocab)
+
+    for name in ARRAYS:
+        path = os.path.join(lang_dir, f"{name}.npy")
+        if name in arrays:
+            _save_array(path, np.asarray(arrays[name], dtype=ARRAYS[name]))
+        elif os.path.exists(path):
+            os.remove(path)
+
+    # meta.json goes last, a cache without it is treated as missing
+    _write_meta(lang_dir, vocab, source, [[0, rows]])
+
+
+def append_part(
+    cache_dir: str, lang: str, vocab: list[str], arrays: dict, digest: str, stop: int
+) -> None:
+    """
+    checkpoints the arrays of source rows [rows so far, stop) as a new part,
+    digest being the fingerprint of those rows alone, fingerprint(texts, stop,
+    start). The rows before are not read again, so a checkpoint costs the same
+    however far the extraction has got
+    """
+    lang_dir = os.path.join(cache_dir, lang)
+    meta = _read_meta(lang_dir)
+    ranges = meta["ranges"]
+    start = ranges[-1][1]
+
+    tmp = _part_path(lang_dir, start) + ".tmp.npz"
+    np.savez(tmp, **{name: arrays[name] for name in REQUIRED})
+    os.replace(tmp, _part_path(lang_dir, start))
+    if len(vocab) > meta["vocab_size"]:
+        write_json(os.path.join(cache_dir, VOCAB_FILE), vocab)
+    # the part only counts once meta.json lists it
+    parts = meta.get("parts", []) + [digest]
+    _write_meta(lang_dir, vocab, meta["source"], ranges + [[start, stop]], parts)
+
+
+def read_cache(cache_dir: str, lang: str, vocab: list[str], texts):
+    """
+    returns (arrays by name, rows covered) for lang, or None if missing or stale.
+    The columnar arrays are memory-mapped unless checkpointed parts have to be
+    merged in, in which case the inverted index is left out as it is incomplete.
+    """
+    lang_dir = os.path.join(cache_dir, lang)
+    meta = _read_meta(lang_dir)
+    if meta is None:
+        return None
+
+    reason = _stale(meta, vocab)
+    if reason is None:
+        if len(texts) < meta["rows"]:
+            reason = "source dataset shrank"
+        elif _changed(meta, texts):
+            reason = "source dataset changed"
+        else:
+            arrays = _load_arrays(lang_dir, meta, ARRAYS)
+            if arrays is not None:
+                return arrays, meta["rows"]
+            reason = "arrays missing"
+
+    print(f"Cache {lang_dir} is stale ({reason})")
+    return None
+
+
+def _changed(meta: dict, texts) -> bool:
+    "whether texts differ from the rows of the first range or of any part"
+    ranges, parts = meta["ranges"], meta.get("parts", [])
+    if len(parts) != len(ranges) - 1:
+        return True
+    if fingerprint(texts, ranges[0][1]) != meta["source"]:
+        return True
+    return any(
+        fingerprint(texts, stop, start) != digest
+        for (start, stop), digest in zip(ranges[1:], parts)
+    )
+
+
+def _stale(meta: dict, vocab: list[str]) -> str | None:
+    "why a cache cannot be used whatever its source, None if it can"
+    if meta.get("version") != CACHE_VERSION:
+        return f"cache version {meta.get('version')} != {CACHE_VERSION}"
+    if meta.get("emoji_version") != emoji.__version__:
+        return f"built with emoji {meta.get('emoji_version')}"
+    if vocab_hash(vocab[: meta["vocab_size"]]) != meta["vocab_hash"]:
+        return f"{VOCAB_FILE} does not match"
+    return None
+
+
+def _load_arrays(lang_dir: str, meta: dict, names) -> dict | None:
+    "memory-maps the arrays in names, merging in checkpointed parts if any"
+    parts = [np.load(_part_path(lang_dir, s)) for s, _ in meta["ranges"][1:]]
+    if parts:
+        # parts only extend the table, the inverted index is rebuilt from it
+        names = REQUIRED
+    arrays = {}
+    for name in names:
+        path = os.path.join(lang_dir, f"{name}.npy")
+        if os.path.exists(path):
+            arrays[name] = np.load(path, mmap_mode="r")
+    if not all(name in arrays for name in REQUIRED if name in names):
+        return None
+    if parts:
+        arrays = _merge([arrays] + parts)
+    return arrays
+
+
+def read_arrays(cache_dir: str, lang: str, vocab: list[str], names=REQUIRED):
+    """
+    (arrays in names, meta) of lang without reading its source dataset, or
+    None if there is no usable cache. The rows are taken to be what meta.json
+    says; only Data checks them against the text. The inverted index is
+    missing while checkpointed parts are unmerged.
+    """
+    lang_dir = os.path.join(cache_dir, lang)
+    meta = _read_meta(lang_dir)
+    if meta is None or _stale(meta, vocab) is not None:
+        return None
+    arrays = _load_arrays(lang_dir, meta, names)
+    if arrays is None:
+        return None
+    return arrays, meta
+
+
+def _merge(parts: list) -> dict:
+    "concatenates CSR arrays of consecutive row ranges"
+    offsets = [np.zeros(1, dtype=np.int64)]
+    end = 0
+    for part in parts:
+        offsets.append(part["offsets"][1:] + end)
+        end += len(part["ids"])
+    return {
+        "ids": np.concatenate([part["ids"] for part in parts]),
+        "offsets": np.concatenate(offsets),
+        "indices": np.concatenate([part["indices"] for part in parts]),
+    }
+
+
+def _derived_key(meta: dict, vocab: list[str]) -> str:
+    "what a derived result depends on: the cached rows and the ids it covers"
+    key = [meta["version"], meta["emoji_version"], meta["source"], meta["ranges"]]
+    if meta.get("parts"):
+        key.append(meta["parts"])
+    key.append(vocab_hash(vocab))
+    return hashlib.sha1(json.dumps(key).encode("utf-8")).hexdigest()
+
+
+def source_key(cache_dir: str, lang: str, vocab: list[str]) -> str | None:
+    "hash of the cached table of lang and the vocabulary, None if nothing is cached"
+    meta = _read_meta(os.path.join(cache_dir, lang))
+    return None if meta is None else _derived_key(meta, vocab)
+
+
+def write_derived(cache_dir: str, lang: str, name: str, vocab: list[str], arrays):
+    "stores arrays computed from the cached table of lang, over ids of vocab"
+    lang_dir = os.path.join(cache_dir, lang)
+    meta = _read_meta(lang_dir)
+    if meta is None:
+        return
+    path = os.path.join(lang_dir, f"{name}.npz")
+    tmp = path + ".tmp.npz"
+    key = np.array(_derived_key(meta, vocab))
+    np.savez(tmp, _key=key, _vocab_size=len(vocab), **arrays)
+    os.replace(tmp, path)
+
+
+def read_derived(cache_dir: str, lang: str, name: str, vocab: list[str]):
+    "the arrays stored by write_derived, or None if the table has changed since"
+    lang_dir = os.path.join(cache_dir, lang)
+    meta = _read_meta(lang_dir)
+    try:
+        arrays = dict(np.load(os.path.join(lang_dir, f"{name}.npz")))
+    except FileNotFoundError:
+        return None
+    size = int(arrays.pop("_vocab_size"))
+    key = str(arrays.pop("_key"))
+    if meta is None or key != _derived_key(meta, vocab[:size]):
+        return None
+    return arrays
@@ -0,0 +1,103 @@
+import csv
+import numpy as np
+
+from emoji_names import NameTable
+from emoji_table import EmojiTable
+
+# A category is a CSV file of emoji names (one row, like handshape_emoji.csv),
+# a collection of emoji names, or a function of (name, kind) -> bool
+DEFAULT_CATEGORIES = {
+    "handshape": "handshape_emoji.csv",
+    "hearts": lambda name, kind: "heart" in name,
+    "faces": lambda name, kind: "face" in name,
+    "flags": lambda name, kind: kind == "flag",
+}
+
+
+def load_category_csv(file: str) -> set[str]:
+    "reads the emoji names listed in the first row of a category CSV"
+    with open(file, "r", newline="") as f:
+        reader = csv.reader(f)
+        return set(next(reader))
+
+
+def lookup_matrix(names: NameTable, categories: dict) -> np.ndarray:
+    "boolean table of vocabulary id x category, True where the emoji is a member"
+    columns = []
+    for category in categories.values():
+        if isinstance(category, str):
+            category = load_category_csv(category)
+        if callable(category):
+            names.update()
+            column = [category(n, k) for n, k in zip(names.names, names.kinds)]
+            columns.append(np.array(column, dtype=bool))
+        else:
+            columns.append(names.lookup(category))
+    if not columns:
+        return np.zeros((len(names.vocab), 0), dtype=bool)
+    return np.stack(columns, axis=1)
+
+
+def membership(table: EmojiTable, matrix: np.ndarray) -> np.ndarray:
+    "boolean table of tweet x category, True where the tweet has any member emoji"
+    if len(table) == 0:
+        return np.zeros((0, matrix.shape[1]), dtype=bool)
+    # every row of the table has at least one emoji, so no reduceat segment is empty
+    return np.logical_or.reduceat(matrix[table.ids], table.offsets[:-1], axis=0)
+
+
+class CategoryTable:
+    "per-tweet membership of every category in every language, from one pass each"
+
+    def __init__(self, langs: list[str], categories: list[str], members: dict):
+        self.langs = langs
+        self.categories = categories
+        self._members = members
+        self.counts = np.array([members[lang].sum(axis=0) for lang in langs])
+        self.totals = np.array([len(members[lang]) for lang in langs])
+
+    @classmethod
+    def from_counts(cls, langs, categories, counts, totals, members) -> "CategoryTable":
+        """
+        a table of counts kept in the result cache, members being a function
+        that computes the per-tweet membership when it is first asked for
+        """
+        table = cls.__new__(cls)
+        table.langs = langs
+        table.categories = categories
+        table._members = members
+        table.counts = np.asarray(counts)
+        table.totals = np.asarray(totals)
+        return table
+
+    @property
+    def members(self) -> dict:
+        "boolean table of tweet x category of each language, see membership"
+        if callable(self._members):
+            self._members = self._members()
+        return self._members
+
+    def shares(self) -> np.ndarray:
+        "fraction of tweets with emoji in each language (rows) hitting each category"
+        return self.counts / np.maximum(self.totals, 1)[:, None]
+
+    def share(self, category: str) -> np.ndarray:
+        return self.shares()[:, self.categories.index(category)]
+
+    def write_csv(self, file: str) -> None:
+        "writes language, category, count, total and share rows"
+        shares = self.shares()
+        with open(file, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["lang", "category", "count", "total", "share"])
+            for i, lang in enumerate(self.langs):
+                for j, category in enumerate(self.categories):
+                    writer.writerow(
+                        [
+                            lang,
+                            category,
+                            self.counts[i, j],
+                            self.totals[i],
+                            shares[i, j],
+                        ]
+                    )
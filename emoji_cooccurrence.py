@@ -0,0 +1,206 @@
+import numpy as np
+
+from emoji_table import EmojiTable, Vocabulary
+
+MEASURES = ("count", "pmi", "npmi")
+
+
+def incidence(table: EmojiTable) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Binary tweet x emoji incidence matrix of table in CSR form (indptr, ids):
+    the distinct ids of the k-th tweet, ascending, are ids[indptr[k]:indptr[k + 1]]
+    """
+    size = max(len(table.vocab), 1)
+    pairs = np.unique(table.rows().astype(np.int64) * size + table.ids)
+    indptr = np.zeros(len(table) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pairs // size, minlength=len(table)), out=indptr[1:])
+    return indptr, (pairs % size).astype(np.int32)
+
+
+def _pair_keys(indptr: np.ndarray, ids: np.ndarray, size: int) -> np.ndarray:
+    "left * size + right for every ordered pair of ids within each row, self included"
+    lengths = np.diff(indptr)
+    # element p of row r pairs with all lengths[r] elements of its row
+    repeat = np.repeat(lengths, lengths)
+    left = np.repeat(ids, repeat).astype(np.int64)
+    starts = np.repeat(np.repeat(indptr[:-1], lengths), repeat)
+    within = np.arange(len(left)) - np.repeat(np.cumsum(repeat) - repeat, repeat)
+    return left * size + ids[starts + within]
+
+
+class Cooccurrence:
+    """
+    Symmetric emoji x emoji matrix of the number of tweets containing both, in
+    CSR form: row e has columns indices[indptr[e]:indptr[e + 1]] with counts
+    data[...] and the diagonal is the number of tweets containing e. It is
+    X^T X for the incidence matrix X, computed by expanding the pairs of each
+    tweet's distinct emoji, so the cost grows with the pairs actually seen.
+    """
+
+    def __init__(self, vocab: Vocabulary, indptr, indices, data, tweets: int):
+        self.vocab = vocab
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.tweets = tweets  # tweets with emoji, the N of the probabilities
+        self.doc_counts = np.zeros(self.size, dtype=np.int64)
+        diagonal = self.indices == self.row_ids()
+        self.doc_counts[self.indices[diagonal]] = self.data[diagonal]
+
+    @property
+    def size(self) -> int:
+        "number of vocabulary ids covered, ids added later have no entries"
+        return len(self.indptr) - 1
+
+    @classmethod
+    def from_table(cls, table: EmojiTable, max_pairs=2**24) -> "Cooccurrence":
+        "counts co-occurrences of table, expanding at most about max_pairs at a time"
+        size = len(table.vocab)
+        indptr, ids = incidence(table)
+
+        # rows are split into runs of about max_pairs pairs to bound memory
+        ends = np.cumsum(np.diff(indptr) ** 2)
+        total = ends[-1] if len(ends) else 0
+        cuts = np.searchsorted(ends, np.arange(max_pairs, total, max_pairs), "right")
+        bounds = np.unique(np.concatenate([[0], cuts, [len(table)]]))
+        keys, counts = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            chunk = indptr[start : stop + 1]
+            pairs = _pair_keys(chunk - chunk[0], ids[chunk[0] : chunk[-1]], size)
+            k, c = np.unique(pairs, return_counts=True)
+            keys.append(k)
+            counts.append(c)
+        if len(keys) > 2:
+            keys, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+            counts = np.bincount(inverse, weights=np.concatenate(counts))
+        else:
+            keys, counts = keys[-1], counts[-1]
+
+        # keys are sorted by (row, column), which is CSR order already
+        row_ptr = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys // max(size, 1), minlength=size), out=row_ptr[1:])
+        return cls(
+            table.vocab,
+            row_ptr,
+            (keys % max(size, 1)).astype(np.int32),
+            np.asarray(counts, dtype=np.int64),
+            len(table),
+        )
+
+    def to_arrays(self) -> dict:
+        return {
+            "indptr": self.indptr,
+            "indices": self.indices,
+            "data": self.data,
+            "tweets": np.array(self.tweets),
+        }
+
+    @classmethod
+    def from_arrays(cls, vocab: Vocabulary, arrays: dict) -> "Cooccurrence":
+        return cls(
+            vocab,
+            arrays["indptr"],
+            arrays["indices"],
+            arrays["data"],
+            int(arrays["tweets"]),
+        )
+
+    def row_ids(self) -> np.ndarray:
+        "row of the matrix that each entry of indices belongs to"
+        return np.repeat(np.arange(self.size, dtype=np.int32), np.diff(self.indptr))
+
+    def count(self, a: str, b: str) -> int:
+        "number of tweets containing both a and b"
+        i, j = self.vocab.get(a), self.vocab.get(b)
+        if not (0 <= i < self.size and 0 <= j < self.size):
+            return 0
+        start, stop = self.indptr[i], self.indptr[i + 1]
+        k = start + np.searchsorted(self.indices[start:stop], j)
+        if k == stop or self.indices[k] != j:
+            return 0
+        return int(self.data[k])
+
+    def _measure(self, measure: str, counts, a, b) -> np.ndarray:
+        "measure of the pairs (a, b) seen together in counts tweets"
+        if measure == "count":
+            return counts.astype(np.float64)
+        if measure not in MEASURES:
+            raise ValueError(f"measure must be one of {MEASURES}")
+        with np.errstate(divide="ignore"):
+            joint = np.log(counts) - np.log(self.tweets)
+            marginal = np.log(self.doc_counts / max(self.tweets, 1))
+        pmi = joint - marginal[a] - marginal[b]
+        if measure == "pmi":
+            return pmi
+        # pairs in every tweet have -log p = 0 and are perfectly associated
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(joint < 0, pmi / -joint, 1.0)
+
+    def values(self, measure="npmi") -> np.ndarray:
+        """
+        measure of every stored entry, aligned with indices: the count, the PMI
+        log(N c_ab / (c_a c_b)) or the NPMI, PMI / -log(c_ab / N), in [-1, 1]
+        """
+        return self._measure(measure, self.data, self.row_ids(), self.indices)
+
+    def top_k(self, k=10, measure="npmi", min_count=5):
+        """
+        k best neighbors of every emoji by measure, in CSR form (indptr, ids,
+        values) over vocabulary ids. Pairs seen in fewer than min_count tweets
+        are left out, as PMI overrates rare ones, and so is the emoji itself.
+        """
+        values = self.values(measure)
+        rows = self.row_ids()
+        keep = (self.data >= min_count) & (self.indices != rows)
+        rows, cols, values = rows[keep], self.indices[keep], values[keep]
+        # best first within each row, ties broken by the more frequent pair
+        order = np.lexsort((-self.data[keep], -values, rows))
+        rows, cols, values = rows[order], cols[order], values[order]
+        start = np.searchsorted(rows, rows)
+        best = np.arange(len(rows)) - start < k
+        indptr = np.zeros(self.size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows[best], minlength=self.size), out=indptr[1:])
+        return indptr, cols[best], values[best]
+
+    def neighbors(self, e: str, k=10, measure="npmi", min_count=5):
+        "the k emoji most associated with e as (emoji, value) pairs, best first"
+        code = self.vocab.get(e)
+        if not 0 <= code < self.size:
+            return []
+        start, stop = self.indptr[code], self.indptr[code + 1]
+        cols = self.indices[start:stop]
+        counts = self.data[start:stop]
+        values = self._measure(measure, counts, code, cols)
+        keep = (counts >= min_count) & (cols != code)
+        order = np.lexsort((-counts[keep], -values[keep]))[:k]
+        return [
+            (self.vocab[c], float(v))
+            for c, v in zip(cols[keep][order], values[keep][order])
+        ]
+
+
+def neighbor_overlap(
+    a: Cooccurrence, b: Cooccurrence, k=10, measure="npmi", min_count=5
+):
+    """
+    Jaccard overlap of the top k neighbor sets of every emoji in both a and b,
+    as (ids, overlaps) over the ids that have neighbors in both. Low overlap
+    means an emoji keeps different company in the two languages.
+    """
+    size = min(a.size, b.size)
+    neighbor_sets = []
+    for cooc in (a, b):
+        indptr, cols, _ = cooc.top_k(k, measure, min_count)
+        rows = np.repeat(np.arange(cooc.size, dtype=np.int64), np.diff(indptr))
+        keep = (rows < size) & (cols < size)
+        neighbor_sets.append(
+            (rows[keep] * size + cols[keep], np.bincount(rows[keep], minlength=size))
+        )
+    (keys_a, sizes_a), (keys_b, sizes_b) = neighbor_sets
+    shared = np.bincount(
+        np.intersect1d(keys_a, keys_b, assume_unique=True) // max(size, 1),
+        minlength=size,
+    )
+    both = np.flatnonzero((sizes_a > 0) & (sizes_b > 0))
+    union = sizes_a[both] + sizes_b[both] - shared[both]
+    return both, shared[both] / union
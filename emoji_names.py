@@ -0,0 +1,73 @@
+import emoji
+import numpy as np
+import re
+from functools import lru_cache
+
+from emoji_table import Vocabulary, strip_skin_tone
+
+_SKIN_TONE_NAME = re.compile(
+    r"(_(light|medium-light|medium|medium-dark|dark)_skin_tone)"
+)
+
+# regional indicator letters and the tag characters of subdivision flags
+_FLAG = re.compile("[\U0001f1e6-\U0001f1ff\U000e0020-\U000e007f]")
+
+
+@lru_cache(maxsize=8192)
+def emoji_name(text: str) -> str:
+    "takes in an emoji and returns the name, stripped of skin_tone"
+    if not emoji.is_emoji(text):
+        return text
+    text = emoji.demojize(text)
+    text = _SKIN_TONE_NAME.sub("", text)
+    return text[1:-1]
+
+
+@lru_cache(maxsize=8192)
+def emoji_kind(text: str) -> str:
+    "coarse kind of an emoji: flag, keycap, zwj, skin_tone, component or emoji"
+    # the emoji package carries no CLDR groups, so this is read off the sequence
+    if _FLAG.search(text) or emoji_name(text).startswith("flag"):
+        return "flag"
+    if "\u20e3" in text:
+        return "keycap"
+    if "\u200d" in text:
+        return "zwj"
+    if strip_skin_tone(text) != text.replace("\ufe0f", ""):
+        return "skin_tone"
+    data = emoji.EMOJI_DATA.get(text)
+    if data and data["status"] == emoji.STATUS["component"]:
+        return "component"
+    return "emoji"
+
+
+class NameTable:
+    """
+    Name, skin-tone-stripped form and kind of every emoji in a vocabulary,
+    computed once per distinct emoji and extended as the vocabulary grows.
+    Lookups are by vocabulary id, so per-tweet code never calls demojize.
+    """
+
+    def __init__(self, vocab: Vocabulary) -> None:
+        self.vocab = vocab
+        self.names = []
+        self.bases = []
+        self.kinds = []
+
+    def update(self) -> None:
+        "adds entries for emoji appended to the vocabulary since the last call"
+        for code in range(len(self.names), len(self.vocab)):
+            e = self.vocab[code]
+            self.names.append(emoji_name(e))
+            self.bases.append(strip_skin_tone(e))
+            self.kinds.append(emoji_kind(e))
+
+    def name(self, code: int) -> str:
+        self.update()
+        return self.names[code]
+
+    def lookup(self, names) -> np.ndarray:
+        "boolean table over vocabulary ids, True where the emoji's name is in names"
+        self.update()
+        names = set(names)
+        return np.fromiter((n in names for n in self.names), bool, len(self.names))
@@ -0,0 +1,115 @@
+import csv
+import numpy as np
+import os
+
+import emoji_categories
+from emoji_names import NameTable
+from emoji_table import EmojiIndex, EmojiTable
+
+# consecutive draws of already used tweets before a stratum is taken to be
+# mostly used up and the rest of it is listed instead
+MAX_MISSES = 32
+
+
+def read_coded(lang: str, types_dir="types") -> set[str]:
+    "text of every tweet already coded in <types_dir>/<lang>/types_N.csv"
+    coded = set()
+    lang_dir = os.path.join(types_dir, lang)
+    try:
+        files = sorted(os.listdir(lang_dir))
+    except FileNotFoundError:
+        return coded
+    for file in files:
+        if file.startswith("types_") and file.endswith(".csv"):
+            with open(os.path.join(lang_dir, file), "r", newline="") as f:
+                coded.update(row[0] for row in csv.reader(f) if row)
+    return coded
+
+
+class Sampler:
+    """
+    Draws tweets of one language without replacement, from every tweet with
+    emoji or from the tweets containing an emoji or a category, skipping
+    tweets whose text is in coded or whose index is in exclude. Strata come
+    from the inverted index and draws are rejection-sampled against the
+    tweets used so far, so the work grows with the sample, not the corpus.
+    The same seed gives the same tweets for the same sequence of calls.
+    """
+
+    def __init__(
+        self,
+        table: EmojiTable,
+        index: EmojiIndex,
+        texts,
+        names: NameTable,
+        seed=None,
+        coded=(),
+        exclude=(),
+    ) -> None:
+        self.table = table
+        self.index = index
+        self.texts = texts
+        self.names = names
+        self.rng = np.random.default_rng(seed)
+        self.coded = set(coded)
+        # dataset indices drawn, skipped as coded, or excluded from the start
+        self.used = set(exclude)
+
+    def candidates(self, emoji=None, category=None, fold_skin_tone=False):
+        """
+        sorted dataset indices of the stratum: tweets with any of emoji (one or
+        a list), with any emoji of category (a name in DEFAULT_CATEGORIES or a
+        category definition), or every tweet with emoji if neither is given
+        """
+        if emoji is not None:
+            emojis = [emoji] if isinstance(emoji, str) else list(emoji)
+            vocab = self.index.vocab
+            if fold_skin_tone:
+                codes = [c for e in emojis for c in vocab.skin_tone_variants(e)]
+            else:
+                codes = [vocab.get(e) for e in emojis]
+            return self.index.tweets_with_ids(codes)
+        if category is not None:
+            if isinstance(category, str):
+                category = emoji_categories.DEFAULT_CATEGORIES.get(category, category)
+            matrix = emoji_categories.lookup_matrix(self.names, {"": category})
+            return self.index.tweets_with_ids(np.flatnonzero(matrix[:, 0]))
+        return self.table.indices
+
+    def _take(self, idx: int) -> bool:
+        "marks idx used, returning whether it can be shown"
+        self.used.add(idx)
+        return not self.coded or str(self.texts[idx]) not in self.coded
+
+    def sample(self, n: int, emoji=None, category=None, fold_skin_tone=False):
+        "up to n dataset indices of the stratum never drawn before, in draw order"
+        candidates = self.candidates(emoji, category, fold_skin_tone)
+        picks = []
+        misses = 0
+        while len(picks) < n and len(candidates) and misses < MAX_MISSES:
+            idx = int(candidates[self.rng.integers(len(candidates))])
+            if idx in self.used:
+                misses += 1
+                continue
+            misses = 0
+            if self._take(idx):
+                picks.append(idx)
+
+        if len(picks) < n and len(candidates):
+            # nearly every tweet of the stratum is used, draw from the rest
+            used = np.fromiter(self.used, dtype=np.int64, count=len(self.used))
+            for idx in self.rng.permutation(np.setdiff1d(candidates, used)).tolist():
+                if len(picks) == n:
+                    break
+                if self._take(idx):
+                    picks.append(idx)
+        return np.array(picks, dtype=np.int64)
+
+    def stratified(self, n: int, emojis=(), categories=(), fold_skin_tone=False):
+        "n tweets from each emoji and each category name, no tweet in two strata"
+        strata = {}
+        for e in emojis:
+            strata[e] = self.sample(n, emoji=e, fold_skin_tone=fold_skin_tone)
+        for category in categories:
+            strata[category] = self.sample(n, category=category)
+        return strata
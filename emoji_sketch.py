@@ -0,0 +1,325 @@
+import base64
+import hashlib
+import math
+import zlib
+
+import numpy as np
+
+from emoji_table import EmojiTable
+
+
+def hash64(items: list[str], seed=0) -> np.ndarray:
+    "64-bit hash of each string, the same in every process and on every machine"
+    key = int(seed).to_bytes(8, "little")
+    return np.array(
+        [
+            int.from_bytes(
+                hashlib.blake2b(item.encode("utf-8"), digest_size=8, key=key).digest(),
+                "little",
+            )
+            for item in items
+        ],
+        dtype=np.uint64,
+    )
+
+
+def _bit_length(x: np.ndarray) -> np.ndarray:
+    "number of bits of each unsigned integer, 0 for 0"
+    x = x.copy()
+    n = np.zeros(len(x), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = x >= np.uint64(1 << shift)
+        n[big] += shift
+        x[big] >>= np.uint64(shift)
+    return n + (x > 0)
+
+
+def _encode(array: np.ndarray) -> str:
+    return base64.b64encode(zlib.compress(array.tobytes())).decode("ascii")
+
+
+def _decode(text: str, dtype, shape) -> np.ndarray:
+    data = zlib.decompress(base64.b64decode(text))
+    return np.frombuffer(data, dtype=dtype).reshape(shape).copy()
+
+
+class CountMin:
+    """
+    Count-Min sketch (Cormode and Muthukrishnan) of weighted counts. With
+    width = ceil(e / epsilon) and depth = ceil(ln(1 / delta)), an estimate is
+    never below the true count and exceeds it by more than epsilon * total
+    with probability at most delta. The depth columns of an item come from
+    its one 64-bit hash by double hashing. Sketches of one shape merge by
+    adding their tables.
+    """
+
+    def __init__(self, width: int, depth: int) -> None:
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self.total = 0
+
+    @classmethod
+    def from_error(cls, epsilon=0.001, delta=0.01) -> "CountMin":
+        return cls(math.ceil(math.e / epsilon), math.ceil(math.log(1 / delta)))
+
+    def _columns(self, hashes: np.ndarray) -> np.ndarray:
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        low = hashes & np.uint64(0xFFFFFFFF)
+        high = (hashes >> np.uint64(32)) | np.uint64(1)
+        rows = np.arange(len(self.table), dtype=np.uint64)[:, None]
+        return ((low + rows * high) % np.uint64(self.table.shape[1])).astype(np.int64)
+
+    def add(self, hashes, counts) -> None:
+        counts = np.asarray(counts, dtype=np.int64)
+        columns = self._columns(hashes)
+        rows = np.broadcast_to(np.arange(len(self.table))[:, None], columns.shape)
+        np.add.at(self.table, (rows, columns), counts)
+        self.total += int(counts.sum())
+
+    def estimate(self, hashes) -> np.ndarray:
+        columns = self._columns(hashes)
+        return self.table[np.arange(len(self.table))[:, None], columns].min(axis=0)
+
+    def merge(self, other: "CountMin") -> None:
+        if self.table.shape != other.table.shape:
+            raise ValueError("Count-Min sketches of different shapes cannot merge")
+        self.table += other.table
+        self.total += other.total
+
+    def to_dict(self) -> dict:
+        return {
+            "width": self.table.shape[1],
+            "depth": self.table.shape[0],
+            "total": self.total,
+            "table": _encode(self.table),
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "CountMin":
+        sketch = cls(d["width"], d["depth"])
+        sketch.table = _decode(d["table"], np.int64, sketch.table.shape)
+        sketch.total = d["total"]
+        return sketch
+
+
+class HyperLogLog:
+    """
+    HyperLogLog (Flajolet et al.) estimate of the number of distinct items,
+    from 2**precision one-byte registers. The relative standard error is
+    about 1.04 / sqrt(2**precision), 0.8% at the default 14, and small counts
+    fall back to linear counting, which is close to exact while most
+    registers are empty. Sketches of one precision merge by taking the
+    larger of each register.
+    """
+
+    def __init__(self, precision=14) -> None:
+        if not 4 <= precision <= 18:
+            raise ValueError("precision must be between 4 and 18")
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add(self, hashes) -> None:
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        bits = 64 - self.precision
+        index = (hashes >> np.uint64(bits)).astype(np.int64)
+        rest = hashes & np.uint64((1 << bits) - 1)
+        # position of the first 1 bit after the index bits
+        rank = bits - _bit_length(rest) + 1
+        np.maximum.at(self.registers, index, rank.astype(np.uint8))
+
+    def estimate(self) -> float:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            return m * math.log(m / zeros)
+        return float(raw)
+
+    def merge(self, other: "HyperLogLog") -> None:
+        if self.precision != other.precision:
+            raise ValueError(
+                "HyperLogLog sketches of different precisions cannot merge"
+            )
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def to_dict(self) -> dict:
+        return {"precision": self.precision, "registers": _encode(self.registers)}
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "HyperLogLog":
+        sketch = cls(d["precision"])
+        sketch.registers = _decode(d["registers"], np.uint8, sketch.registers.shape)
+        return sketch
+
+
+class SpaceSaving:
+    """
+    Space-Saving summary (Metwally et al.) of the capacity heaviest items,
+    each with a count that is an upper bound and the most it may overcount.
+    For a total N: count - error <= true count <= count, overcounts are at
+    most N / capacity, and every item whose true count is above N / capacity
+    is kept. Any item not kept has a true count of at most floor. Batches
+    and other summaries are folded in by the parallel Space-Saving rule
+    (Cafaro et al.): an item missing from one side is taken at that side's
+    floor, then the capacity largest are kept, which keeps the same bounds
+    for the combined total. While fewer than capacity items were ever seen
+    the counts are exact.
+    """
+
+    def __init__(self, capacity=1024) -> None:
+        self.capacity = capacity
+        self.counts = {}  # item -> [count, error]
+        self.total = 0
+        self.floor = 0
+
+    def add(self, items, counts) -> None:
+        "folds in exact counts of items, e.g. one batch"
+        entries = {item: [int(c), 0] for item, c in zip(items, counts)}
+        self._fold(entries, 0, sum(c for c, _ in entries.values()))
+
+    def merge(self, other: "SpaceSaving") -> None:
+        if self.capacity != other.capacity:
+            raise ValueError("Space-Saving summaries of different sizes cannot merge")
+        self._fold(other.counts, other.floor, other.total)
+
+    def _fold(self, entries: dict, floor: int, total: int) -> None:
+        merged = {}
+        for item, (count, error) in self.counts.items():
+            other = entries.get(item, (floor, floor))
+            merged[item] = [count + other[0], error + other[1]]
+        for item, (count, error) in entries.items():
+            if item not in merged:
+                merged[item] = [count + self.floor, error + self.floor]
+        self.floor += floor
+        if len(merged) > self.capacity:
+            order = sorted(merged, key=lambda item: -merged[item][0])
+            self.floor = max(self.floor, merged[order[self.capacity]][0])
+            merged = {item: merged[item] for item in order[: self.capacity]}
+        self.counts = merged
+        self.total += total
+
+    def top(self, k: int) -> list[tuple[str, int, int]]:
+        "(item, count, error) of the k largest counts"
+        order = sorted(self.counts, key=lambda item: -self.counts[item][0])[:k]
+        return [(item, *self.counts[item]) for item in order]
+
+    def to_dict(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "total": self.total,
+            "floor": self.floor,
+            "counts": self.counts,
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "SpaceSaving":
+        summary = cls(d["capacity"])
+        summary.total = d["total"]
+        summary.floor = d["floor"]
+        summary.counts = {item: list(entry) for item, entry in d["counts"].items()}
+        return summary
+
+
+class EmojiSketch:
+    """
+    Approximate emoji statistics of any number of tweets in fixed memory:
+    the heaviest emoji by tweets containing them (Space-Saving), the tweets
+    containing any one emoji (Count-Min) and the number of distinct emoji
+    (HyperLogLog), plus exact tweet and token totals. Emoji are hashed by
+    their text rather than their vocabulary id, so sketches built by other
+    processes or machines merge as long as they share their arguments.
+    """
+
+    def __init__(
+        self, capacity=1024, epsilon=0.001, delta=0.01, precision=14, seed=0
+    ) -> None:
+        self.args = {
+            "capacity": capacity,
+            "epsilon": epsilon,
+            "delta": delta,
+            "precision": precision,
+            "seed": seed,
+        }
+        self.top_docs = SpaceSaving(capacity)
+        self.docs = CountMin.from_error(epsilon, delta)
+        self.types = HyperLogLog(precision)
+        self.tweets = 0
+        self.tokens = 0
+        self._vocab = None
+        self._hashes = np.zeros(0, dtype=np.uint64)  # of each id of _vocab
+
+    def _hash_ids(self, vocab, ids: np.ndarray) -> np.ndarray:
+        "hashes of vocabulary ids, each emoji hashed once per vocabulary"
+        if vocab is not self._vocab:
+            self._vocab = vocab
+            self._hashes = np.zeros(0, dtype=np.uint64)
+        if len(self._hashes) < len(vocab):
+            new = vocab.emojis[len(self._hashes) :]
+            self._hashes = np.concatenate(
+                [self._hashes, hash64(new, self.args["seed"])]
+            )
+        return self._hashes[ids]
+
+    def update(self, table: EmojiTable) -> None:
+        "adds the tweets of table, one shard or batch at a time"
+        counts = table.doc_counts()
+        ids = np.flatnonzero(counts)
+        hashes = self._hash_ids(table.vocab, ids)
+        self.top_docs.add([table.vocab[i] for i in ids], counts[ids])
+        self.docs.add(hashes, counts[ids])
+        self.types.add(hashes)
+        self.tweets += len(table)
+        self.tokens += table.num_tokens
+
+    def estimate(self, emojis: list[str]) -> np.ndarray:
+        """
+        tweets containing each emoji, never under and, with probability
+        1 - delta, over by at most epsilon * docs.total, the tweet counts of
+        every emoji summed
+        """
+        estimates = self.docs.estimate(hash64(emojis, self.args["seed"]))
+        # both bounds are from above, so the smaller one is kept
+        for i, e in enumerate(emojis):
+            bound = self.top_docs.counts.get(e, (self.top_docs.floor,))[0]
+            estimates[i] = min(estimates[i], bound)
+        return estimates
+
+    def top(self, k: int) -> list[tuple[str, int]]:
+        "the k emoji in the most tweets, with their estimated tweet counts"
+        top = self.top_docs.top(k)
+        estimates = self.estimate([e for e, _, _ in top]) if top else []
+        return [(e, int(n)) for (e, _, _), n in zip(top, estimates)]
+
+    def num_types(self) -> int:
+        return round(self.types.estimate())
+
+    def merge(self, other: "EmojiSketch") -> None:
+        if self.args != other.args:
+            raise ValueError(
+                f"Sketches made with {self.args} and {other.args} cannot merge"
+            )
+        self.top_docs.merge(other.top_docs)
+        self.docs.merge(other.docs)
+        self.types.merge(other.types)
+        self.tweets += other.tweets
+        self.tokens += other.tokens
+
+    def to_dict(self) -> dict:
+        return {
+            "args": self.args,
+            "tweets": self.tweets,
+            "tokens": self.tokens,
+            "top_docs": self.top_docs.to_dict(),
+            "docs": self.docs.to_dict(),
+            "types": self.types.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "EmojiSketch":
+        sketch = cls(**d["args"])
+        sketch.tweets = d["tweets"]
+        sketch.tokens = d["tokens"]
+        sketch.top_docs = SpaceSaving.from_dict(d["top_docs"])
+        sketch.docs = CountMin.from_dict(d["docs"])
+        sketch.types = HyperLogLog.from_dict(d["types"])
+        return sketch
@@ -0,0 +1,191 @@
+import csv
+import itertools
+import math
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+# replicates drawn per task, each task with its own child seed, so results do
+# not depend on how many processes the blocks are spread over
+BLOCK = 100
+
+_erfc = np.vectorize(math.erfc, otypes=[np.float64])
+
+
+def chi2_sf(x, df: int) -> np.ndarray:
+    "upper tail probability of the chi-square distribution with integer df"
+    h = np.asarray(x, dtype=np.float64) / 2
+    if df % 2 == 0:
+        # Q(m, h) = exp(-h) * sum of h^i / i! for i < m
+        term = np.exp(-h)
+        total = term.copy()
+        for i in range(1, df // 2):
+            term = term * h / i
+            total += term
+        return total
+    # odd df adds half-integer terms h^(i - 1/2) / gamma(i + 1/2) to erfc
+    total = _erfc(np.sqrt(h))
+    term = np.exp(-h) * np.sqrt(h) / math.gamma(1.5)
+    for i in range(1, (df + 1) // 2):
+        total += term
+        term = term * h / (i + 0.5)
+    return total
+
+
+def proportions(counts: np.ndarray, totals: np.ndarray) -> np.ndarray:
+    "share of each language's tweets (rows) containing each emoji (columns)"
+    return counts / np.maximum(totals, 1)[:, None]
+
+
+def z_test(counts: np.ndarray, totals: np.ndarray, a=0, b=1):
+    "pooled two-proportion z statistic and two-sided p-value of rows a and b"
+    p = proportions(counts, totals)
+    pooled = (counts[a] + counts[b]) / max(totals[a] + totals[b], 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        se = np.sqrt(pooled * (1 - pooled) * (1 / totals[a] + 1 / totals[b]))
+        z = np.where(se > 0, (p[a] - p[b]) / se, 0.0)
+    return z, _erfc(np.abs(z) / math.sqrt(2))
+
+
+def chi_square(counts: np.ndarray, totals: np.ndarray):
+    """
+    Pearson chi-square test of homogeneity of every emoji across languages, on
+    the languages x (with, without) table of each one. Returns the statistics
+    and p-values with len(totals) - 1 degrees of freedom.
+    """
+    observed = np.stack([counts, totals[:, None] - counts])  # 2 x L x V
+    expected = (
+        observed.sum(axis=1, keepdims=True)
+        * totals[None, :, None]
+        / max(totals.sum(), 1)
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cells = np.where(expected > 0, (observed - expected) ** 2 / expected, 0.0)
+    stat = cells.sum(axis=(0, 1))
+    return stat, chi2_sf(stat, len(totals) - 1)
+
+
+def bh_adjust(p: np.ndarray) -> np.ndarray:
+    "Benjamini-Hochberg q-values, controlling the false discovery rate over p"
+    p = np.asarray(p, dtype=np.float64)
+    order = np.argsort(p)
+    scaled = p[order] * len(p) / np.arange(1, len(p) + 1)
+    q = np.empty_like(p)
+    q[order] = np.minimum(np.minimum.accumulate(scaled[::-1])[::-1], 1.0)
+    return q
+
+
+def _bootstrap_block(counts, totals, replicates: int, seed, method: str):
+    "max - min proportion across languages of every emoji, in replicates resamples"
+    rng = np.random.default_rng(seed)
+    shape = counts.shape + (replicates,)
+    if method == "poisson":
+        # every tweet weighted by Poisson(1), totals taken as fixed
+        draws = rng.poisson(np.broadcast_to(counts[..., None], shape))
+    else:
+        # resampling n tweets with replacement leaves each emoji's count
+        # Binomial(n, p), so only the counts are drawn, never the tweets
+        p = proportions(counts, totals)[..., None]
+        draws = rng.binomial(totals[:, None, None], np.broadcast_to(p, shape))
+    props = draws / np.maximum(totals, 1)[:, None, None]
+    return props.max(axis=0) - props.min(axis=0)
+
+
+def bootstrap_range(
+    counts: np.ndarray,
+    totals: np.ndarray,
+    replicates=1000,
+    alpha=0.05,
+    seed=497,
+    workers=1,
+    method="binomial",
+):
+    """
+    Percentile bootstrap (1 - alpha) interval of max - min proportion across
+    languages for every emoji at once. Replicates are drawn in blocks of BLOCK
+    with seeds spawned from seed, over workers processes if more than one.
+    """
+    sizes = [min(BLOCK, replicates - s) for s in range(0, replicates, BLOCK)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = (
+        [counts] * len(sizes),
+        [totals] * len(sizes),
+        sizes,
+        seeds,
+        [method] * len(sizes),
+    )
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            blocks = list(pool.map(_bootstrap_block, *args))
+    else:
+        blocks = list(map(_bootstrap_block, *args))
+    stats = np.concatenate(blocks, axis=1)
+    low, high = np.quantile(stats, [alpha / 2, 1 - alpha / 2], axis=1)
+    return low, high
+
+
+class DifferenceTable:
+    """
+    Difference in the share of tweets containing every emoji across languages:
+    max - min proportion with a bootstrap interval, the chi-square test of
+    homogeneity and its Benjamini-Hochberg q-value, and the two-proportion z
+    test of every pair of languages (z[k] is positive where pairs[k][0] has
+    the higher share), over emoji seen anywhere.
+    """
+
+    def __init__(self, langs: list[str], ids, counts, totals, **bootstrap):
+        self.langs = langs
+        self.ids = np.asarray(ids)
+        self.counts = counts[:, self.ids]
+        self.totals = np.asarray(totals)
+        props = proportions(self.counts, self.totals)
+        self.diff = props.max(axis=0) - props.min(axis=0)
+        self.argmax = props.argmax(axis=0)
+        self.stat, self.p = chi_square(self.counts, self.totals)
+        self.q = bh_adjust(self.p)
+        self.pairs = list(itertools.combinations(range(len(self.langs)), 2))
+        self.z = np.zeros((len(self.pairs), len(self.ids)))
+        self.z_p = np.ones((len(self.pairs), len(self.ids)))
+        for k, (a, b) in enumerate(self.pairs):
+            self.z[k], self.z_p[k] = z_test(self.counts, self.totals, a, b)
+        self.low, self.high = bootstrap_range(self.counts, self.totals, **bootstrap)
+
+    def order(self, by="diff", alpha=None) -> np.ndarray:
+        """
+        positions sorted by diff, p or low (the lower interval bound, a
+        difference that survives resampling), keeping q < alpha if given
+        """
+        keep = np.arange(len(self.ids))
+        if alpha is not None:
+            keep = keep[self.q[keep] < alpha]
+        key = {"diff": -self.diff, "p": self.p, "low": -self.low}[by]
+        return keep[np.argsort(key[keep], kind="stable")]
+
+    def write_csv(self, file: str, vocab) -> None:
+        "writes one row per emoji, most different first"
+        with open(file, "w", newline="") as f:
+            writer = csv.writer(f)
+            pairs = [f"{self.langs[a]}_{self.langs[b]}" for a, b in self.pairs]
+            writer.writerow(
+                ["emoji", "highest", "diff", "low", "high", "chi2", "p", "q"]
+                + [f"count_{lang}" for lang in self.langs]
+                + [f"{column}_{pair}" for pair in pairs for column in ("z", "p")]
+            )
+            for i in self.order():
+                writer.writerow(
+                    [
+                        vocab[self.ids[i]],
+                        self.langs[self.argmax[i]],
+                        self.diff[i],
+                        self.low[i],
+                        self.high[i],
+                        self.stat[i],
+                        self.p[i],
+                        self.q[i],
+                    ]
+                    + self.counts[:, i].tolist()
+                    + [
+                        value
+                        for k in range(len(self.pairs))
+                        for value in (self.z[k, i], self.z_p[k, i])
+                    ]
+                )
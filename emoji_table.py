@@ -0,0 +1,213 @@
+import numpy as np
+import re
+
+# Fitzpatrick modifiers and the emoji presentation selector, which differs
+# between a bare base emoji (✌️) and its skin-toned form (✌🏽)
+_SKIN_TONE = re.compile("[\U0001f3fb-\U0001f3ff\ufe0f]")
+
+
+def strip_skin_tone(e: str) -> str:
+    "folds skin-toned variants of an emoji onto one key"
+    return _SKIN_TONE.sub("", e)
+
+
+class Vocabulary:
+    "emoji <-> integer id mapping shared by every language, ids never change"
+
+    def __init__(self, emojis: list[str] | None = None) -> None:
+        self.emojis = list(emojis) if emojis else []
+        self.codes = {e: i for i, e in enumerate(self.emojis)}
+        self._folded = []
+        self._folded_codes = {}
+
+    def __len__(self) -> int:
+        return len(self.emojis)
+
+    def __getitem__(self, code: int) -> str:
+        return self.emojis[code]
+
+    def intern(self, e: str) -> int:
+        "returns the id of e, adding it to the end of the vocabulary if it is new"
+        code = self.codes.get(e)
+        if code is None:
+            code = self.codes[e] = len(self.emojis)
+            self.emojis.append(e)
+        return code
+
+    def get(self, e: str) -> int:
+        "returns the id of e, or -1 if it has never been seen"
+        return self.codes.get(e, -1)
+
+    def skin_tone_variants(self, e: str) -> list[int]:
+        "ids of every emoji that folds to the same key as e"
+        if len(self._folded) < len(self.emojis):
+            for code in range(len(self._folded), len(self.emojis)):
+                key = strip_skin_tone(self.emojis[code])
+                self._folded_codes.setdefault(key, []).append(code)
+                self._folded.append(key)
+        return self._folded_codes.get(strip_skin_tone(e), [])
+
+
+class EmojiTable:
+    """
+    Emoji of every tweet that has any, stored CSR-style: the emoji ids of the
+    k-th tweet are ids[offsets[k]:offsets[k + 1]] and it is tweet indices[k]
+    of the source dataset. Indexing and iterating give the old
+    (list[str], tweet_index) tuples, so code written against lists still works.
+    """
+
+    def __init__(self, vocab: Vocabulary, ids, offsets, indices) -> None:
+        self.vocab = vocab
+        self.ids = ids
+        self.offsets = offsets
+        self.indices = indices
+        self._doc_counts = None
+
+    @classmethod
+    def from_rows(cls, rows, vocab: Vocabulary) -> "EmojiTable":
+        "builds a table from (emoji_list, tweet_index) rows, interning into vocab"
+        ids = [vocab.intern(e) for emojis, _ in rows for e in emojis]
+        lengths = np.fromiter((len(emojis) for emojis, _ in rows), np.int64, len(rows))
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return cls(
+            vocab,
+            np.array(ids, dtype=np.int32),
+            offsets,
+            np.fromiter((idx for _, idx in rows), np.int32, len(rows)),
+        )
+
+    @classmethod
+    def concat(cls, tables: list["EmojiTable"]) -> "EmojiTable":
+        "joins tables of consecutive tweet ranges that share a vocabulary"
+        offsets = [np.zeros(1, dtype=np.int64)]
+        end = 0
+        for table in tables:
+            offsets.append(np.asarray(table.offsets[1:]) + end)
+            end += len(table.ids)
+        return cls(
+            tables[0].vocab,
+            np.concatenate([table.ids for table in tables]),
+            np.concatenate(offsets),
+            np.concatenate([table.indices for table in tables]),
+        )
+
+    def head(self, k: int) -> "EmojiTable":
+        "the first k tweets of the table"
+        end = self.offsets[k]
+        return EmojiTable(
+            self.vocab, self.ids[:end], self.offsets[: k + 1], self.indices[:k]
+        )
+
+    def take(self, rows) -> "EmojiTable":
+        "the tweets at the given rows of the table, in that order"
+        rows = np.asarray(rows, dtype=np.int64)
+        starts = np.asarray(self.offsets[rows])
+        lengths = np.asarray(self.offsets[rows + 1]) - starts
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        # position in ids of every emoji of the chosen rows, row after row
+        positions = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return EmojiTable(self.vocab, self.ids[positions], offsets, self.indices[rows])
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __getitem__(self, k: int) -> tuple[list[str], int]:
+        ids = self.ids[self.offsets[k] : self.offsets[k + 1]]
+        return [self.vocab[i] for i in ids.tolist()], int(self.indices[k])
+
+    def __iter__(self):
+        emojis = [self.vocab[i] for i in self.ids.tolist()]
+        offsets = self.offsets.tolist()
+        for k, idx in enumerate(self.indices.tolist()):
+            yield emojis[offsets[k] : offsets[k + 1]], idx
+
+    @property
+    def num_tokens(self) -> int:
+        return len(self.ids)
+
+    def lengths(self) -> np.ndarray:
+        "number of emoji in each tweet"
+        return np.diff(self.offsets)
+
+    def rows(self) -> np.ndarray:
+        "row of the table that each entry of ids belongs to"
+        return np.repeat(np.arange(len(self), dtype=np.int32), self.lengths())
+
+    def token_counts(self) -> np.ndarray:
+        "number of times each vocabulary id occurs, counting repeats within a tweet"
+        return np.bincount(self.ids, minlength=len(self.vocab))
+
+    def doc_counts(self) -> np.ndarray:
+        "number of tweets containing each vocabulary id at least once"
+        if self._doc_counts is None or len(self._doc_counts) < len(self.vocab):
+            size = len(self.vocab)
+            pairs = np.unique(self.rows().astype(np.int64) * size + self.ids)
+            self._doc_counts = np.bincount(pairs % size, minlength=size)
+        return self._doc_counts
+
+    def count_tweets_with(self, e: str) -> int:
+        "number of tweets containing emoji e"
+        code = self.vocab.get(e)
+        return int(self.doc_counts()[code]) if code >= 0 else 0
+
+
+class EmojiIndex:
+    """
+    Inverted index of an EmojiTable: the tweet indices containing vocabulary
+    id e are postings[offsets[e]:offsets[e + 1]], sorted and without repeats.
+    Ids added to the vocabulary after the index was built have no postings.
+    """
+
+    def __init__(self, vocab: Vocabulary, postings, offsets) -> None:
+        self.vocab = vocab
+        self.postings = postings
+        self.offsets = offsets
+
+    @classmethod
+    def from_table(cls, table: EmojiTable) -> "EmojiIndex":
+        n = max(len(table), 1)
+        # sorting (id, row) keys groups by emoji, with rows ascending within each
+        pairs = np.unique(table.ids.astype(np.int64) * n + table.rows())
+        counts = np.bincount(pairs // n, minlength=len(table.vocab))
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        postings = np.asarray(table.indices, dtype=np.int32)[pairs % n]
+        return cls(table.vocab, postings, offsets)
+
+    def _postings(self, code: int) -> np.ndarray:
+        if code < 0 or code + 1 >= len(self.offsets):
+            return np.empty(0, dtype=np.int32)
+        return self.postings[self.offsets[code] : self.offsets[code + 1]]
+
+    def tweets_with(self, e: str, fold_skin_tone=False) -> np.ndarray:
+        "sorted tweet indices containing e, or any skin tone of e if fold_skin_tone"
+        if not fold_skin_tone:
+            return self._postings(self.vocab.get(e))
+        return self.tweets_with_ids(self.vocab.skin_tone_variants(e))
+
+    def tweets_with_ids(self, codes) -> np.ndarray:
+        "sorted tweet indices containing any of the vocabulary ids in codes"
+        lists = [self._postings(code) for code in codes]
+        if not lists:
+            return np.empty(0, dtype=np.int32)
+        if len(lists) == 1:
+            return lists[0]
+        return np.unique(np.concatenate(lists))
+
+    def count(self, e: str, fold_skin_tone=False) -> int:
+        "number of tweets containing e"
+        return len(self.tweets_with(e, fold_skin_tone))
+
+    def tweets_with_all(self, emojis: list[str], fold_skin_tone=False) -> np.ndarray:
+        "sorted tweet indices containing every emoji in emojis"
+        lists = [self.tweets_with(e, fold_skin_tone) for e in emojis]
+        if not lists:
+            return np.empty(0, dtype=np.int32)
+        # intersect the shortest postings first so the working set stays small
+        lists.sort(key=len)
+        output = lists[0]
+        for postings in lists[1:]:
+            output = np.intersect1d(output, postings, assume_unique=True)
+        return output
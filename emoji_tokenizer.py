@@ -0,0 +1,121 @@
+import emoji
+import re
+import sys
+import timeit
+from random import Random
+
+ZWJ = "\u200d"
+
+# trie over every emoji sequence in EMOJI_DATA, "" marks the end of a sequence
+_TREE = {}
+for _seq in emoji.EMOJI_DATA:
+    _node = _TREE
+    for _char in _seq:
+        _node = _node.setdefault(_char, {})
+    _node[""] = True
+
+
+def _block_class(chars, gap=64) -> re.Pattern:
+    "character class of ranges covering chars, merging ranges closer than gap"
+    codes = sorted(ord(c) for c in chars)
+    ranges = [[codes[0], codes[0]]]
+    for code in codes[1:]:
+        if code - ranges[-1][1] <= gap:
+            ranges[-1][1] = code
+        else:
+            ranges.append([code, code])
+    body = "".join(f"{re.escape(chr(a))}-{re.escape(chr(b))}" for a, b in ranges)
+    return re.compile(f"[{body}]")
+
+
+# every emoji sequence contains a non-ASCII codepoint from these blocks, so text
+# without any of them cannot contain emoji. A few ranges keep the scan fast, the
+# merged gaps only cause false positives that the tokenizer then rejects
+_EMOJI_BLOCKS = _block_class(
+    {c for seq in emoji.EMOJI_DATA for c in seq if not c.isascii()}
+)
+# candidate positions for the start of an emoji sequence, checked against _TREE
+_START = _block_class(_TREE)
+
+
+def _analyze(text: str) -> list[str]:
+    return [token.chars for token in emoji.analyze(text, join_emoji=True)]
+
+
+def has_emoji(text: str) -> bool:
+    "cheap check for any codepoint that can be part of an emoji"
+    return not text.isascii() and _EMOJI_BLOCKS.search(text) is not None
+
+
+def tokenize(text: str) -> list[str]:
+    "returns the emoji in text, matching emoji.analyze(text, join_emoji=True) chars"
+    if not has_emoji(text):
+        return []
+    if ZWJ in text:
+        # ZWJ joining has backtracking rules, leave those to the emoji library
+        return _analyze(text)
+
+    # same greedy walk as emoji.tokenize: follow the trie as far as the text
+    # goes and only match if that node ends a sequence (no backtracking)
+    output = []
+    length = len(text)
+    match = _START.search(text)
+    while match:
+        i = match.start()
+        node = _TREE.get(text[i])
+        if node is None:
+            match = _START.search(text, i + 1)
+            continue
+        j = i + 1
+        while j < length and text[j] in node:
+            node = node[text[j]]
+            j += 1
+        if "" in node:
+            output.append(text[i:j])
+            match = _START.search(text, j)
+        else:
+            match = _START.search(text, i + 1)
+    return output
+
+
+def main():
+    """
+    checks tokenize() against emoji.analyze and times both, exiting with an
+    error on any mismatch. Usage: emoji_tokenizer.py [dataset path] [tweets],
+    without a path the tweets are synthetic ones from benchmark.generate
+    """
+    path = sys.argv[1] if len(sys.argv) > 1 else None
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+
+    if path is None:
+        from benchmark import generate
+
+        # dense in emoji, with ZWJ sequences, skin tones and unspaced tweets
+        sample, _ = generate("en", n, density=0.3, zwj=0.1, skin=0.2, seed=497)
+    else:
+        from datasets import load_from_disk
+
+        texts = load_from_disk(path)["text"]
+        rng = Random(497)
+        rows = rng.sample(range(len(texts)), min(n, len(texts)))
+        sample = [texts[i] for i in rows]
+    sample = [text.replace("❤", "❤️") for text in sample]
+
+    mismatches = 0
+    for text in sample:
+        if tokenize(text) != _analyze(text):
+            mismatches += 1
+            if mismatches <= 10:
+                print("MISMATCH:", repr(text))
+    print(f"{len(sample)} tweets checked, {mismatches} mismatches")
+    if mismatches:
+        sys.exit(1)
+
+    old = min(timeit.repeat(lambda: [_analyze(t) for t in sample], number=1, repeat=3))
+    new = min(timeit.repeat(lambda: [tokenize(t) for t in sample], number=1, repeat=3))
+    print(f"emoji.analyze: {len(sample) / old:,.0f} tweets/s")
+    print(f"tokenize:      {len(sample) / new:,.0f} tweets/s ({old / new:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+import numpy as np
+
+import emoji_categories
+from emoji_table import EmojiTable
+
+MISSING_DAY = np.iinfo(np.int32).min  # read_days of rows without a usable date
+
+# period name -> numpy datetime64 unit. Weeks are numpy's, counted from the
+# Thursday 1970-01-01, so every week starts on a Thursday
+PERIODS = {"day": "D", "week": "W", "month": "M", "year": "Y"}
+
+
+def period_ids(days: np.ndarray, period="month") -> np.ndarray:
+    "period of each day since 1970 as an integer of the unit, -1 where missing"
+    unit = PERIODS[period]
+    valid = days != MISSING_DAY
+    ids = np.full(len(days), -1, dtype=np.int64)
+    dates = days[valid].astype("datetime64[D]")
+    ids[valid] = dates.astype(f"datetime64[{unit}]").astype(np.int64)
+    return ids
+
+
+class TrendTable:
+    """
+    Per-period counts of one language: dataset rows, tweets with emoji, tweets
+    and occurrences of each emoji id and tweets hitting each category. Every
+    count is a sum over tweets, so add() folds new tweets in without touching
+    the old ones, and rolling windows are differences of cumulative sums that
+    only grow at the end while new tweets fall in new periods.
+    """
+
+    def __init__(self, period: str, categories: list[str], matrix, vocab_size=0):
+        self.period = period
+        self.unit = PERIODS[period]
+        self.categories = list(categories)
+        self.matrix = matrix  # vocab x category membership, see lookup_matrix
+        self.start = 0  # period id of the first row of every array
+        self.rows = np.zeros(0, dtype=np.int64)
+        self.tweets = np.zeros(0, dtype=np.int64)
+        self.doc_counts = np.zeros((0, vocab_size), dtype=np.int32)
+        self.token_counts = np.zeros((0, vocab_size), dtype=np.int32)
+        self.categories_counts = np.zeros((0, len(categories)), dtype=np.int64)
+        self._cumsums = {}
+
+    @classmethod
+    def from_table(
+        cls, table: EmojiTable, days, period="month", categories=(), matrix=None
+    ) -> "TrendTable":
+        "counts of every tweet of table, days being the day of each dataset row"
+        if matrix is None:
+            matrix = np.zeros((len(table.vocab), len(categories)), dtype=bool)
+        trends = cls(period, categories, matrix, len(table.vocab))
+        trends.add(table, days)
+        return trends
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def labels(self) -> list[str]:
+        "each period as an ISO date string of its unit, e.g. 2019-07"
+        ids = np.arange(self.start, self.start + len(self))
+        return [str(p) for p in ids.astype(f"datetime64[{self.unit}]")]
+
+    def _grow(self, first: int, last: int, vocab_size: int) -> None:
+        "widens every array to cover periods [first, last] and vocab_size ids"
+        if len(self) == 0:
+            self.start = first
+        before = max(self.start - first, 0)
+        after = max(last - (self.start + len(self) - 1), 0)
+        width = max(vocab_size - self.doc_counts.shape[1], 0)
+        if before or after or width:
+            pad = ((before, after),)
+            self.rows = np.pad(self.rows, pad)
+            self.tweets = np.pad(self.tweets, pad)
+            self.doc_counts = np.pad(self.doc_counts, pad + ((0, width),))
+            self.token_counts = np.pad(self.token_counts, pad + ((0, width),))
+            self.categories_counts = np.pad(self.categories_counts, pad + ((0, 0),))
+            self.start -= before
+        if before:
+            # every period moved, so no cumulative sum can be kept
+            self._cumsums = {}
+
+    def add(self, table: EmojiTable, days, start=0, matrix=None) -> None:
+        """
+        folds the tweets of table into the counts, days being the day of each
+        dataset row from start on, each counted in its period's row total.
+        Tables of consecutive row ranges can be added one after another.
+        matrix replaces the category matrix when the vocabulary has grown
+        """
+        indices = np.asarray(table.indices, dtype=np.int64)
+        if len(indices) and indices[0] < start:
+            raise ValueError(f"Tweet {indices[0]} is before the days from row {start}")
+        if matrix is not None:
+            self.matrix = matrix
+        days = np.asarray(days)
+        row_periods = period_ids(days, self.period)
+        dated = row_periods[row_periods >= 0]
+        if len(dated) == 0:
+            return
+        size = max(len(table.vocab), self.doc_counts.shape[1])
+        first, last = int(dated.min()), int(dated.max())
+        self._grow(first, last, size)
+        n = len(self)
+
+        # period of every tweet of the table and, through its row, every token
+        p = row_periods[indices - start]
+        p[p >= 0] -= self.start
+        rows = table.rows()
+        token_p = p[rows]
+        ok = token_p >= 0
+        ids = np.asarray(table.ids, dtype=np.int64)[ok]
+        keys = token_p[ok] * size + ids
+        self.token_counts += np.bincount(keys, minlength=n * size).reshape(n, size)
+        # a tweet counts once per emoji however often the emoji repeats in it
+        # keys come grouped by row, so a stable sort is close to a linear pass
+        row_keys = np.sort(rows[ok].astype(np.int64) * size + ids, kind="stable")
+        row_keys = row_keys[np.r_[True, row_keys[1:] != row_keys[:-1]]]
+        doc_keys = p[row_keys // size] * size + row_keys % size
+        self.doc_counts += np.bincount(doc_keys, minlength=n * size).reshape(n, size)
+
+        self.rows += np.bincount(dated - self.start, minlength=n)
+        dated_tweets = p >= 0
+        self.tweets += np.bincount(p[dated_tweets], minlength=n)
+        if self.categories:
+            matrix = self.matrix
+            if len(matrix) < len(table.vocab):
+                # ids the matrix predates are in no category
+                extra = len(table.vocab) - len(matrix)
+                matrix = np.pad(matrix, ((0, extra), (0, 0)))
+            members = emoji_categories.membership(table, matrix)[dated_tweets]
+            for j in range(len(self.categories)):
+                self.categories_counts[:, j] += np.bincount(
+                    p[dated_tweets], weights=members[:, j], minlength=n
+                ).astype(np.int64)
+
+        # cumulative sums stay valid up to the first period that changed
+        for name, cumsum in self._cumsums.items():
+            self._cumsums[name] = cumsum[: first - self.start + 1]
+
+    def _field(self, name: str) -> np.ndarray:
+        return self.categories_counts if name == "categories" else getattr(self, name)
+
+    def _cumsum(self, name: str) -> np.ndarray:
+        "cumulative sum of a field along periods, with a zero row in front"
+        array = self._field(name)
+        cumsum = self._cumsums.get(name)
+        if cumsum is None or cumsum.shape[1:] != array.shape[1:]:
+            cumsum = np.zeros((1,) + array.shape[1:], dtype=np.int64)
+        done = len(cumsum) - 1
+        if done < len(array):
+            # only the periods added or changed since the last call are summed
+            tail = np.cumsum(array[done:], axis=0, dtype=np.int64) + cumsum[-1]
+            cumsum = self._cumsums[name] = np.concatenate([cumsum, tail])
+        return cumsum
+
+    def window(self, name: str, window=1) -> np.ndarray:
+        "field summed over each period and the window - 1 periods before it"
+        if window == 1:
+            return self._field(name)
+        cumsum = self._cumsum(name)
+        back = np.maximum(np.arange(1, len(cumsum)) - window, 0)
+        return cumsum[1:] - cumsum[back]
+
+    def percent_with_emoji(self, window=1) -> np.ndarray:
+        return self.window("tweets", window) / np.maximum(
+            self.window("rows", window), 1
+        )
+
+    def frequency(self, codes=None, window=1) -> np.ndarray:
+        "share of tweets with emoji containing each id in codes, period x code"
+        doc_counts = self.window("doc_counts", window)
+        if codes is not None:
+            codes = np.asarray(codes, dtype=np.int64)
+            valid = (codes >= 0) & (codes < doc_counts.shape[1])
+            doc_counts = np.where(valid, doc_counts[:, np.where(valid, codes, 0)], 0)
+        return doc_counts / np.maximum(self.window("tweets", window), 1)[:, None]
+
+    def category_shares(self, window=1) -> np.ndarray:
+        "share of tweets with emoji hitting each category, period x category"
+        tweets = self.window("tweets", window)
+        return self.window("categories", window) / np.maximum(tweets, 1)[:, None]
+
+    def type_token_ratio(self, window=1) -> np.ndarray:
+        "distinct emoji over emoji tokens in each period, or window of periods"
+        tokens = self.window("token_counts", window)
+        return np.count_nonzero(tokens, axis=1) / np.maximum(tokens.sum(axis=1), 1)
+
+    def to_arrays(self) -> dict:
+        return {
+            "start": np.array(self.start),
+            "rows": self.rows,
+            "tweets": self.tweets,
+            "doc_counts": self.doc_counts,
+            "token_counts": self.token_counts,
+            "categories_counts": self.categories_counts,
+            "category_names": np.array(self.categories, dtype=str),
+        }
+
+    @classmethod
+    def from_arrays(cls, period: str, matrix, arrays: dict) -> "TrendTable":
+        trends = cls(period, arrays["category_names"].tolist(), matrix)
+        trends.start = int(arrays["start"])
+        trends.rows = arrays["rows"]
+        trends.tweets = arrays["tweets"]
+        trends.doc_counts = arrays["doc_counts"]
+        trends.token_counts = arrays["token_counts"]
+        trends.categories_counts = arrays["categories_counts"]
+        return trends
@@ -1,17 +1,10 @@
-from datasets import load_dataset, Dataset
-import pandas as pd
+import ingest
 
 
 def main():
-    size = 500000
-    file = "emojitweets-01-04-2018.txt"
-    data = pd.read_csv(file)
-
-    dataset = Dataset.from_pandas(data)
-    dataset = dataset.select(range(size))
-    print(len(dataset))
-    print(dataset["text"][0])
-    dataset.save_to_disk("../en_data")
+    # the source file, size and sampling of English are in ingest.json now;
+    # set "sample" to "reservoir" for a random sample of the whole file
+    ingest.ingest(ingest.load_config(), langs=["en"])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,277 @@
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from datasets import Dataset, load_dataset, load_from_disk
+from pyarrow import csv
+
+import emoji_cache
+from upload_filtered_data import (
+    compact_dates,
+    compact_table,
+    filter_dataset,
+    sample_early_exit,
+)
+
+# Each language in the config has a source and optional filters and sampling:
+#
+#   {"lang": "it", "label": "Italian", "color": "#FF7F0E",
+#    "source": {"type": "parquet", "path": "it_data/train.parquet"},
+#    "rename": {"created_at": "date"},
+#    "filters": {"min_date": "2018", "require_emoji": true},
+#    "size": 500000, "sample": "shuffle", "seed": 497}
+#
+# source types: csv, parquet, hf (a Hugging Face dataset id in "id") and disk
+# (a save_to_disk directory, e.g. a local stand-in for a hub dataset).
+# sample: prefix keeps the first size rows, shuffle a seeded random size rows,
+# reservoir streams a CSV twice instead of loading it, early_exit reads random
+# parquet row groups until size rows pass the filters.
+CONFIG = "ingest.json"
+SOURCES = ("csv", "parquet", "hf", "disk")
+SAMPLES = ("prefix", "shuffle", "reservoir", "early_exit")
+# bump when prepare() writes different columns, so every language is redone
+FORMAT = 2  # 2: keeps the date as date32 next to the text
+
+
+def _open(file: str, block_mb: int):
+    "streaming CSV reader, memory use is a few blocks regardless of file size"
+    read_options = csv.ReadOptions(block_size=block_mb * 2**20)
+    return csv.open_csv(file, read_options=read_options)
+
+
+def read_prefix(file: str, size: int, block_mb=16) -> pa.Table:
+    "reads the first size rows of a CSV file, stopping as soon as they are read"
+    batches = []
+    rows = 0
+    for batch in _open(file, block_mb):
+        batches.append(batch.slice(0, size - rows))
+        rows += len(batches[-1])
+        if rows >= size:
+            break
+    return pa.Table.from_batches(batches)
+
+
+def read_sample(file: str, size: int, seed=497, block_mb=16) -> pa.Table:
+    """
+    Uniform random sample of size rows of a CSV file, in file order. The first
+    pass keeps a reservoir of row numbers only, the second reads those rows.
+    """
+    rng = np.random.default_rng(seed)
+    reservoir = np.empty(size, dtype=np.int64)
+    seen = 0
+    for batch in _open(file, block_mb):
+        rows = np.arange(seen, seen + len(batch))
+        seen += len(batch)
+        # algorithm R: row i replaces a random slot with probability size / (i + 1)
+        fill = rows[rows < size]
+        reservoir[fill] = fill
+        rest = rows[rows >= size]
+        slots = rng.integers(0, rest + 1)
+        hit = slots < size
+        reservoir[slots[hit]] = rest[hit]
+    chosen = pa.array(np.sort(reservoir[: min(size, seen)]))
+
+    batches = []
+    start = 0
+    for batch in _open(file, block_mb):
+        rows = pa.array(np.arange(start, start + len(batch)))
+        start += len(batch)
+        batches.append(batch.filter(pc.is_in(rows, value_set=chosen)))
+    return pa.Table.from_batches(batches)
+
+
+def load_config(file=CONFIG) -> dict:
+    "reads an ingestion config, YAML if the extension says so and JSON otherwise"
+    with open(file, "r", encoding="utf-8") as f:
+        if file.endswith((".yaml", ".yml")):
+            import yaml
+
+            config = yaml.safe_load(f)
+        else:
+            config = json.load(f)
+    for spec in config["languages"]:
+        if spec["source"]["type"] not in SOURCES:
+            raise ValueError(f"{spec['lang']}: unknown source {spec['source']}")
+        if spec.get("sample", "prefix") not in SAMPLES:
+            raise ValueError(f"{spec['lang']}: unknown sample {spec['sample']}")
+    return config
+
+
+def spec_hash(spec: dict) -> str:
+    "hash of everything that decides a language's output, to skip unchanged ones"
+    keys = ("source", "rename", "filters", "size", "sample", "seed")
+    spec = {key: spec.get(key) for key in keys}
+    spec["format"] = FORMAT
+    return hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+
+def _load(source: dict) -> Dataset:
+    "the whole source as a dataset, memory-mapped where the format allows"
+    if source["type"] == "csv":
+        # keeps a single copy in Arrow memory, never in pandas
+        return Dataset(pa.Table.from_batches(_open(source["path"], 16)))
+    if source["type"] == "parquet":
+        return load_dataset("parquet", data_files={"train": source["path"]})["train"]
+    if source["type"] == "hf":
+        return load_dataset(source["id"], split=source.get("split", "train"))
+    return load_from_disk(source["path"])
+
+
+def prepare(spec: dict, out: str, num_proc=None) -> int:
+    "builds one language's dataset of text as spec says and saves it to out"
+    source = spec["source"]
+    filters = spec.get("filters")
+    size = spec["size"]
+    sample = spec.get("sample", "prefix")
+    seed = spec.get("seed", 497)
+
+    if sample == "early_exit":
+        if source["type"] != "parquet":
+            raise ValueError(f"{spec['lang']}: early_exit needs a parquet source")
+        filters = filters or {}
+        dataset = sample_early_exit(
+            source["path"],
+            size,
+            min_date=filters.get("min_date"),
+            seed=seed,
+            rename=spec.get("rename"),
+            require_emoji=filters.get("require_emoji", True),
+        )
+    elif source["type"] == "csv" and not filters and sample != "shuffle":
+        # reads no more of the file than the sample needs
+        if sample == "reservoir":
+            table = read_sample(source["path"], size, seed)
+        else:
+            table = read_prefix(source["path"], size)
+        dataset = Dataset(compact_table(table))
+    else:
+        dataset = _load(source)
+        if spec.get("rename"):
+            dataset = dataset.rename_columns(spec["rename"])
+        if filters:
+            dataset = filter_dataset(
+                dataset,
+                min_date=filters.get("min_date"),
+                num_proc=num_proc,
+                require_emoji=filters.get("require_emoji", True),
+            )
+        if sample != "prefix":
+            dataset = dataset.shuffle(seed=seed)
+        dataset = dataset.select(range(min(size, len(dataset))))
+        # drops every other column, only the kept rows have their date converted
+        dataset = compact_dates(dataset, num_proc)
+
+    dataset.save_to_disk(out)
+    return len(dataset)
+
+
+def read_registry(file: str) -> dict:
+    "lang -> registry entry, empty if nothing has been ingested yet"
+    try:
+        with open(file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _entry(spec: dict, path: str, rows: int, registry_file: str) -> dict:
+    return {
+        "label": spec.get("label", spec["lang"]),
+        "color": spec.get("color"),
+        # relative to the registry, so the two can be moved together
+        "path": os.path.relpath(path, os.path.dirname(os.path.abspath(registry_file))),
+        "rows": rows,
+        "spec": spec_hash(spec),
+    }
+
+
+def ingest(config: dict, langs=None, jobs=None, num_proc=None, force=False) -> dict:
+    """
+    Prepares every language of config (or only langs) in a pool of jobs
+    processes, each filtering with num_proc processes of its own (by default
+    an even share of the CPUs), and records each output in the registry as
+    soon as it is saved. Languages whose spec and output are unchanged since
+    the last run are skipped unless force.
+    """
+    out_dir = config.get("out_dir", "..")
+    registry_file = config.get("registry", os.path.join(out_dir, "registry.json"))
+    os.makedirs(os.path.dirname(os.path.abspath(registry_file)), exist_ok=True)
+    registry = read_registry(registry_file)
+    specs = [s for s in config["languages"] if langs is None or s["lang"] in langs]
+
+    todo = []
+    for spec in specs:
+        out = os.path.join(out_dir, f"{spec['lang']}_data")
+        entry = registry.get(spec["lang"])
+        if (
+            not force
+            and entry is not None
+            and entry["spec"] == spec_hash(spec)
+            and os.path.isdir(out)
+        ):
+            print(f"{spec['lang']} unchanged, keeping {out}")
+            # label and color do not change the data, so refresh them anyway
+            registry[spec["lang"]] = _entry(spec, out, entry["rows"], registry_file)
+        else:
+            todo.append((spec, out))
+
+    # the order of the config is the order Data plots languages in
+    order = [s["lang"] for s in config["languages"]]
+
+    def save():
+        ordered = sorted(
+            registry,
+            key=lambda lang: order.index(lang) if lang in order else len(order),
+        )
+        emoji_cache.write_json(
+            registry_file, {lang: registry[lang] for lang in ordered}
+        )
+
+    save()
+    if not todo:
+        return registry
+    jobs = jobs or len(todo)
+    if num_proc is None:
+        num_proc = max(1, (os.cpu_count() or 1) // min(jobs, len(todo)))
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(prepare, s, out, num_proc): (s, out) for s, out in todo}
+        for future in as_completed(futures):
+            spec, out = futures[future]
+            rows = future.result()
+            print(f"{spec['lang']}: {rows} tweets saved to {out}")
+            registry[spec["lang"]] = _entry(spec, out, rows, registry_file)
+            save()
+    return registry
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Prepare every language's tweets and register them for Data"
+    )
+    parser.add_argument("config", nargs="?", default=CONFIG, help="JSON or YAML")
+    parser.add_argument("--langs", nargs="+", default=None)
+    parser.add_argument("--jobs", type=int, default=None, help="languages at once")
+    parser.add_argument(
+        "--num-proc",
+        type=int,
+        default=None,
+        help="filter processes per language, default: CPUs / languages at once",
+    )
+    parser.add_argument("--force", action="store_true")
+    args = parser.parse_args()
+    ingest(
+        load_config(args.config),
+        langs=args.langs,
+        jobs=args.jobs,
+        num_proc=args.num_proc,
+        force=args.force,
+    )
+
+
+if __name__ == "__main__":
+    main()
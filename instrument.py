@@ -0,0 +1,262 @@
+import contextlib
+import functools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+
+# checked before anything else is done, so disabled spans, counters and
+# decorated methods cost one global lookup and a call
+ENABLED = False
+_recorder = None
+_NULL = contextlib.nullcontext()
+_STAGE_KEYS = ("calls", "seconds", "peak_rss")
+
+
+def _status(field: str) -> int | None:
+    "a field of /proc/self/status in bytes, None where there is no /proc"
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith(field):
+                    return int(line.split()[1]) * 1024
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def reset_peak() -> bool:
+    "resets the peak RSS of this process, where Linux allows it"
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss() -> int:
+    "peak RSS in bytes since the last reset, or since the process started"
+    peak = _status("VmHWM:")
+    if peak is not None:
+        return peak
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Recorder:
+    """
+    Spans, counters and memory high-water marks of one run. Counters are
+    added to the process totals and to every span open at the time, so each
+    span knows how many tweets, tokens or cache hits happened inside it.
+    """
+
+    def __init__(self, profile=None, profiler="cprofile") -> None:
+        self.start = time.perf_counter()
+        self.spans = []  # finished spans, in the order they ended
+        self.open = []
+        self.counters = {}
+        self.samples = []  # (time, counter, total) for the trace
+        self.profile = profile
+        self.profiler = None
+        self.profiling = False
+        if profile is not None:
+            self.profiler = self._profiler(profiler)
+
+    @staticmethod
+    def _profiler(kind: str):
+        if kind == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                raise ImportError("pip install pyinstrument to use it as profiler")
+            return Profiler()
+        import cProfile
+
+        return cProfile.Profile()
+
+    def _start_profile(self) -> None:
+        if hasattr(self.profiler, "enable"):
+            self.profiler.enable()
+        else:
+            self.profiler.start()
+
+    def _stop_profile(self) -> None:
+        if hasattr(self.profiler, "disable"):
+            self.profiler.disable()
+        else:
+            self.profiler.stop()
+
+    @contextlib.contextmanager
+    def span(self, name: str, args: dict):
+        entry = {
+            "name": name,
+            "start": time.perf_counter() - self.start,
+            "args": args,
+            "counters": {},
+            "tid": threading.get_ident(),
+        }
+        profile = name == self.profile and not self.profiling
+        if profile:
+            self.profiling = True
+            self._start_profile()
+        self.open.append(entry)
+        try:
+            yield entry
+        finally:
+            self.open.remove(entry)
+            if profile:
+                self._stop_profile()
+                self.profiling = False
+            entry["seconds"] = time.perf_counter() - self.start - entry["start"]
+            entry["peak_rss"] = peak_rss()
+            entry["rss"] = _status("VmRSS:")
+            self.spans.append(entry)
+
+    def count(self, name: str, n: int) -> None:
+        total = self.counters[name] = self.counters.get(name, 0) + n
+        for entry in self.open:
+            entry["counters"][name] = entry["counters"].get(name, 0) + n
+        self.samples.append((time.perf_counter() - self.start, name, total))
+
+    def summary(self) -> dict:
+        """
+        totals per span name: calls, seconds, highest peak RSS, counters and
+        counters per second, plus every span and the process counters
+        """
+        stages = {}
+        for entry in self.spans:
+            stage = stages.setdefault(
+                entry["name"], {"calls": 0, "seconds": 0.0, "peak_rss": 0}
+            )
+            stage["calls"] += 1
+            stage["seconds"] += entry["seconds"]
+            stage["peak_rss"] = max(stage["peak_rss"], entry["peak_rss"])
+            for counter, n in entry["counters"].items():
+                stage[counter] = stage.get(counter, 0) + n
+        for stage in stages.values():
+            for counter in [key for key in stage if key not in _STAGE_KEYS]:
+                stage[f"{counter}_per_second"] = stage[counter] / max(
+                    stage["seconds"], 1e-9
+                )
+        return {
+            "seconds": time.perf_counter() - self.start,
+            "peak_rss": peak_rss(),
+            "counters": dict(self.counters),
+            "stages": stages,
+            "spans": self.spans,
+        }
+
+    def trace_events(self) -> list[dict]:
+        "spans as Chrome trace complete events and counters as counter events"
+        pid = os.getpid()
+        events = []
+        for entry in self.spans:
+            args = dict(entry["args"], **entry["counters"])
+            args["peak_rss"] = entry["peak_rss"]
+            events.append(
+                {
+                    "name": entry["name"],
+                    "ph": "X",
+                    "ts": entry["start"] * 1e6,
+                    "dur": entry["seconds"] * 1e6,
+                    "pid": pid,
+                    "tid": entry["tid"],
+                    "args": args,
+                }
+            )
+        for t, name, total in self.samples:
+            events.append(
+                {
+                    "name": name,
+                    "ph": "C",
+                    "ts": t * 1e6,
+                    "pid": pid,
+                    "args": {name: total},
+                }
+            )
+        return events
+
+    def write_profile(self, file: str) -> None:
+        "writes the profile of the chosen stage, pstats or pyinstrument HTML"
+        if self.profiler is None:
+            return
+        if hasattr(self.profiler, "dump_stats"):
+            self.profiler.dump_stats(file)
+        else:
+            with open(file, "w", encoding="utf-8") as f:
+                f.write(self.profiler.output_html())
+
+
+def enable(profile=None, profiler="cprofile") -> Recorder:
+    """
+    starts recording spans and counters, profiling every span named profile
+    with cProfile or, if profiler is "pyinstrument", with pyinstrument
+    """
+    global ENABLED, _recorder
+    _recorder = Recorder(profile, profiler)
+    ENABLED = True
+    return _recorder
+
+
+def disable() -> Recorder | None:
+    "stops recording, returning what was recorded"
+    global ENABLED
+    ENABLED = False
+    return _recorder
+
+
+def span(name: str, **args):
+    "context manager timing the code inside it as one span, args kept with it"
+    if not ENABLED:
+        return _NULL
+    return _recorder.span(name, args)
+
+
+def count(name: str, n=1) -> None:
+    "adds n to the counter name"
+    if ENABLED:
+        _recorder.count(name, n)
+
+
+def timed(function=None, name=None):
+    "decorator recording every call of function as a span, named after it"
+
+    def decorate(function):
+        label = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return function(*args, **kwargs)
+            with _recorder.span(label, {}):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorate(function) if function is not None else decorate
+
+
+def summary() -> dict:
+    return _recorder.summary() if _recorder else {}
+
+
+def write_json(file: str) -> None:
+    "writes summary() as JSON"
+    with open(file, "w", encoding="utf-8") as f:
+        json.dump(summary(), f, ensure_ascii=False, indent=1)
+
+
+def write_trace(file: str) -> None:
+    "writes a trace for chrome://tracing or ui.perfetto.dev"
+    events = _recorder.trace_events() if _recorder else []
+    with open(file, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+def write_profile(file: str) -> None:
+    if _recorder:
+        _recorder.write_profile(file)
@@ -1,70 +1,259 @@
-from datasets import load_from_disk
 import numpy as np
 import emoji
+import emoji_tokenizer
+import emoji_cache
+import emoji_names
+import emoji_categories
+import emoji_stats
+import instrument
+from annotations import TYPES, AnnotationStore, join_rows, type_matrix
+from emoji_sampler import Sampler, read_coded
+from emoji_cooccurrence import Cooccurrence, neighbor_overlap
+from emoji_sketch import EmojiSketch
+from emoji_table import EmojiIndex, EmojiTable, Vocabulary
+from result_cache import File, ResultCache
 import csv
-from tqdm import tqdm
-import matplotlib as mpl
-import matplotlib.pyplot as plt
-from collections import Counter
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from random import randrange
 import ast
-import re
+import getpass
+import json
 import os
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from emoji_trends import TrendTable
+
+
+def extract_single_emoji(text: str) -> list:
+    "returns the emoji in text in order, with ❤ normalized to ❤️"
+    return emoji_tokenizer.tokenize(text.replace("❤", "❤️"))
+
+
+def _extract_chunk(texts, start: int) -> list[tuple[list[str], int]]:
+    "extracts one shard of tweets, keeping the dataset index of each tweet"
+    output = []
+    for i, text in enumerate(texts, start):
+        just_emoji = extract_single_emoji(text)
+        if just_emoji:
+            output.append((just_emoji, i))
+    return output
 
 
 class Data:
     size = 500000
+    workers = 1  # processes used for extraction, 1 keeps it in this process
+    chunk_size = 10000  # tweets per shard when workers > 1
     graph_dir = "graphs"
-    langs = ["en", "it"]  # CHANGE THIS ONE
+    cache_dir = "cache"
+    # written by ingest.py, the languages below are used when it is missing
+    registry = "../registry.json"
+    annotations = "annotations.sqlite"  # manual type labels of every coder
+    results_dir = "results"  # memoized analysis results, None turns it off
+    results_max_bytes = 256 * 2**20
+    # approximate counts for top_emoji_counts, most_different and num_types, so
+    # their plots and report.py, from sketches made with sketch_args (see EmojiSketch)
+    sketch = False
+    sketch_args = {}
+    langs = ["en", "it"]
     labels = ["English", "Italian"]
     colors = ["#1F77B4", "#FF7F0E"]
 
     # labels = {lang: label for lang, label in zip(langs, labels)}
-    lang_data = {}
-    lang_emoji = {}
-
-    def __init__(self, test=False) -> None:
-        # load in language datasets
+    store = None
+    results = None
+
+    @instrument.timed(name="Data.__init__")
+    def __init__(self, test=False, workers=None, lazy=False) -> None:
+        """
+        lazy keeps each dataset memory-mapped, reading a tweet only when it is
+        asked for, and takes the emoji from the cache without extracting any
+        """
+        if workers is not None:
+            self.workers = workers
+        self.lazy = lazy
+        # tables and results kept in memory, by language, never shared
+        self.lang_data = {}
+        self.lang_emoji = {}
+        self.lang_index = {}
+        self.lang_cooc = {}
+        self.lang_trends = {}
+        self.lang_sketch = {}
+        self.vocab = Vocabulary(emoji_cache.load_vocab(self.cache_dir))
+        self.names = emoji_names.NameTable(self.vocab)
+        self.paths = {lang: f"../{lang}_data" for lang in self.langs}
         if test:
-            for lang in self.langs:
-                self.lang_data[lang] = load_from_disk(
-                    f"./test/{lang}_data"
-                ).with_format("numpy")
-                self.lang_data[lang] = self.lang_data[lang]["text"]
+            self.paths = {lang: f"./test/{lang}_data" for lang in self.langs}
         else:
-            for lang in self.langs:
-                self.lang_data[lang] = load_from_disk(f"../{lang}_data").with_format(
-                    "numpy"
-                )
-                self.lang_data[lang] = self.lang_data[lang]["text"]
+            self.read_registry()
+
+        # load in language datasets
+        for lang in self.langs:
+            with instrument.span("load_text", lang=lang):
+                self.lang_data[lang] = self.load_text(self.paths[lang])
 
         # process datasets
         for lang in self.langs:
-            self._extract_emoji(lang)
+            if lazy:
+                with instrument.span("load_cached", lang=lang):
+                    self._load_cached(lang)
+            else:
+                with instrument.span("extract_emoji", lang=lang):
+                    self._extract_emoji(lang)
+
+    def load_text(self, path: str):
+        "text column of a save_to_disk directory, indexable like a numpy array"
+        # imported here, as each takes longer to import than a cached query
+        if self.lazy:
+            from arrow_text import ArrowText
+
+            return ArrowText(path)
+        from datasets import load_from_disk
+
+        return load_from_disk(path).with_format("numpy")["text"]
+
+    def read_registry(self) -> None:
+        "takes languages, labels, colors and dataset paths from the ingest registry"
+        try:
+            with open(self.registry, "r", encoding="utf-8") as f:
+                registry = json.load(f)
+        except FileNotFoundError:
+            print(f"No registry {self.registry}, using {', '.join(self.langs)}")
+            return
+        base = os.path.dirname(self.registry)
+        self.langs = list(registry)
+        self.labels = [registry[lang]["label"] for lang in self.langs]
+        self.colors = [
+            registry[lang]["color"] or f"C{i}" for i, lang in enumerate(self.langs)
+        ]
+        self.paths = {
+            lang: os.path.join(base, registry[lang]["path"]) for lang in self.langs
+        }
 
     def _extract_emoji(self, lang):
         "Extract datasets into single lists of emoji and their associated tweet indices"
-        output = []
-        dataset = self.lang_data[lang]
-
-        output = self.read_from_csv(lang)
-        if output:
-            print(f"CSV file {lang}_emoji.csv found, drawing data from file")
-            self.lang_emoji[lang] = output
+        total = min(len(self.lang_data[lang]), self.size)
+
+        done = self.read_cache(lang)
+        if done is not None:
+            instrument.count("cache_hits")
+            print(f"Cache {self.cache_dir}/{lang} found, drawing data from cache")
+        elif os.path.exists(f"{lang}_emoji.csv") and not os.path.exists(
+            f"{self.cache_dir}/{lang}"
+        ):
+            # migrate caches written before the columnar format
+            instrument.count("cache_misses")
+            print(f"CSV file {lang}_emoji.csv found, converting to {self.cache_dir}")
+            rows = self.read_from_csv(lang)
+            self.lang_emoji[lang] = EmojiTable.from_rows(rows, self.vocab)
+            self.write_cache(lang, total)
+            done = total
         else:
-            print(f"CSV file {lang}_emoji.csv not found, processing dataset")
-
-            for i, data in enumerate(tqdm(dataset)):
-                # limit size to 500000
-                if i >= self.size:
-                    break
+            instrument.count("cache_misses")
+            print(f"No usable cache for {lang}, processing dataset")
+            self.lang_emoji[lang] = EmojiTable.from_rows([], self.vocab)
+            self.write_cache(lang, 0)
+            done = 0
+
+        if done > total:
+            # size was lowered: the cache keeps every row, the table those below
+            if lang not in self.lang_index:
+                self.write_cache(lang, done)
+            table = self.lang_emoji[lang]
+            self.lang_emoji[lang] = table.head(np.searchsorted(table.indices, total))
+            self.lang_index[lang] = EmojiIndex.from_table(self.lang_emoji[lang])
+        elif done < total:
+            if done > 0:
+                print(f"Resuming {lang} from tweet {done} of {total}")
+            self._extract_range(lang, done, total)
+            self.write_cache(lang, total)
+        elif lang not in self.lang_index:
+            # finished but killed before the checkpoints were merged
+            self.write_cache(lang, total)
+
+    def _load_cached(self, lang: str) -> None:
+        "takes the emoji of lang from the cache as it is, for lazy mode"
+        total = min(len(self.lang_data[lang]), self.size)
+        done = self.read_cache(lang)
+        if done is None:
+            raise FileNotFoundError(
+                f"No usable cache for {lang} in {self.cache_dir}, run Data() first"
+            )
+        if done > total:
+            table = self.lang_emoji[lang]
+            self.lang_emoji[lang] = table.head(np.searchsorted(table.indices, total))
+            self.lang_index.pop(lang, None)
+        elif done < total:
+            print(f"Cache {self.cache_dir}/{lang} covers {done} of {total} tweets")
+        if lang not in self.lang_index:
+            self.lang_index[lang] = EmojiIndex.from_table(self.lang_emoji[lang])
+
+    def _extract_range(self, lang: str, start: int, stop: int) -> None:
+        "extracts tweets [start, stop) in chunks, checkpointing each to the cache"
+        from tqdm import tqdm
 
-                # remove non-emoji text
-                just_emoji = self.extract_single_emoji(data)
-                if just_emoji:
-                    output.append((just_emoji, i))
-            self.lang_emoji[lang] = output
-            self.write_to_csv(lang)
+        dataset = self.lang_data[lang]
+        starts = range(start, stop, self.chunk_size)
+
+        digests = {}
+
+        def shard(s):
+            with instrument.span("materialize", start=s):
+                texts = dataset[s : min(s + self.chunk_size, stop)]
+            # the checkpoint's fingerprint, taken while the rows are in memory
+            digests[s] = emoji_cache.fingerprint(texts, len(texts))
+            return texts
+
+        def extract(pool):
+            "rows of each shard in order, with at most 2 * workers shards in flight"
+            if pool is None:
+                yield from map(_extract_chunk, map(shard, starts), starts)
+                return
+            # submitting every shard at once would hold them all in memory
+            pending = deque()
+            for s in starts:
+                pending.append(pool.submit(_extract_chunk, shard(s), s))
+                if len(pending) >= 2 * self.workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+        tables = [self.lang_emoji[lang]]
+        pool = ProcessPoolExecutor(self.workers) if self.workers > 1 else None
+        try:
+            # results come in shard order, so indices stay sorted
+            results = extract(pool)
+            with tqdm(total=stop - start) as bar:
+                for s in starts:
+                    end = min(s + self.chunk_size, stop)
+                    # with workers this is the wait for the shard's result
+                    with instrument.span("tokenize", start=s):
+                        rows = next(results)
+                    with instrument.span("build_table", start=s):
+                        part = EmojiTable.from_rows(rows, self.vocab)
+                    tables.append(part)
+                    arrays = {
+                        "ids": part.ids,
+                        "offsets": part.offsets,
+                        "indices": part.indices,
+                    }
+                    with instrument.span("append_part", start=s):
+                        emoji_cache.append_part(
+                            self.cache_dir,
+                            lang,
+                            self.vocab.emojis,
+                            arrays,
+                            digests.pop(s),
+                            end,
+                        )
+                    instrument.count("tweets", end - s)
+                    instrument.count("emoji_tokens", part.num_tokens)
+                    bar.update(end - s)
+        finally:
+            if pool:
+                pool.shutdown()
+        self.lang_emoji[lang] = EmojiTable.concat(tables)
 
     def get_random_tweet_with_emoji(self, lang) -> None:
         "Prints a new tweet after every keypress, until 'C' is pressed"
@@ -81,12 +270,43 @@ class Data:
             kyp = input()
 
     def extract_single_emoji(self, text: str) -> list:
-        text = text.replace("❤", "❤️")
-        parsed = emoji.analyze(text, join_emoji=True)
-        output = []
-        for token in parsed:
-            output.append(token.chars)
-        return output
+        return extract_single_emoji(text)
+
+    @instrument.timed
+    def write_cache(self, lang: str, rows: int) -> None:
+        "writes <lang>_emoji[], covering the first rows tweets, and its inverted index"
+        table = self.lang_emoji[lang]
+        self.lang_index[lang] = EmojiIndex.from_table(table)
+        arrays = {
+            "ids": table.ids,
+            "offsets": table.offsets,
+            "indices": table.indices,
+            "postings": self.lang_index[lang].postings,
+            "postings_offsets": self.lang_index[lang].offsets,
+        }
+        source = emoji_cache.fingerprint(self.lang_data[lang], rows)
+        emoji_cache.write_cache(
+            self.cache_dir, lang, self.vocab.emojis, arrays, source, rows
+        )
+
+    @instrument.timed
+    def read_cache(self, lang: str) -> int | None:
+        "reads the cache of lang, returning how many tweets it covers or None if unusable"
+        cached = emoji_cache.read_cache(
+            self.cache_dir, lang, self.vocab.emojis, self.lang_data[lang]
+        )
+        if cached is None:
+            return None
+        arrays, rows = cached
+        self.lang_emoji[lang] = EmojiTable(
+            self.vocab, arrays["ids"], arrays["offsets"], arrays["indices"]
+        )
+        self.lang_index.pop(lang, None)
+        if "postings" in arrays:
+            self.lang_index[lang] = EmojiIndex(
+                self.vocab, arrays["postings"], arrays["postings_offsets"]
+            )
+        return rows
 
     def write_to_csv(self, lang: str):
         "writes <lang>_emoji[] to csv file <lang>_emoji.csv"
@@ -95,6 +315,7 @@ class Data:
             writer = csv.writer(f)
             writer.writerows(self.lang_emoji[lang])
 
+    @instrument.timed
     def read_from_csv(self, lang: str) -> list[tuple[list[str], int]]:
         "reads <lang>_emoji.csv to attribute <lang>_emoji[]"
         file = lang + "_emoji.csv"
@@ -105,84 +326,312 @@ class Data:
                 for row in reader:
                     emojis = ast.literal_eval(row[0])
                     output.append((emojis, int(row[1])))
+            instrument.count("csv_rows", len(output))
         except FileNotFoundError:
             print(f"CSV file {file} not found")
         return output
 
+    @instrument.timed
+    def char_counts(self, lang: str) -> np.ndarray:
+        "number of characters in each tweet of lang with emoji, in table order"
+        indices = self.lang_emoji[lang].indices
+        counts = np.zeros(len(indices), dtype=np.int64)
+        for s in range(0, len(indices), self.chunk_size):
+            rows = indices[s : s + self.chunk_size].tolist()
+            counts[s : s + len(rows)] = np.char.str_len(self.lang_data[lang][rows])
+        return counts
+
+    def num_chars(self, lang: str) -> int:
+        "characters in all tweets of lang with emoji"
+        return self._memo(
+            "num_chars", [lang], [], lambda: int(self.char_counts(lang).sum())
+        )
+
+    def doc_counts(self, lang: str) -> np.ndarray:
+        "tweets of lang containing each emoji id, duplicates in a tweet counted once"
+        return self._memo("doc_counts", [lang], [], self.lang_emoji[lang].doc_counts)
+
+    def _memo(self, name: str, langs: list[str], args, compute):
+        """
+        compute(), read from the result cache while the cached tables of langs,
+        the vocabulary and args (with the contents of any File among them) are
+        unchanged, so repeated analyses skip straight to plotting
+        """
+        if self.results_dir is None:
+            return compute()
+        sources = []
+        for lang in langs:
+            key = emoji_cache.source_key(self.cache_dir, lang, self.vocab.emojis)
+            if key is None:
+                return compute()
+            # the table is shorter than its cache when size was lowered
+            sources.append([lang, key, len(self.lang_emoji[lang])])
+        if self.results is None:
+            self.results = ResultCache(self.results_dir, self.results_max_bytes)
+        return self.results.memo([name, sources, args], compute)
+
+    def rows(self, lang: str) -> int:
+        "dataset rows of lang searched for emoji"
+        return min(len(self.lang_data[lang]), self.size)
+
+    def share_with_emoji(self, lang: str) -> float:
+        "share of the rows of lang with any emoji"
+        return len(self.lang_emoji[lang]) / max(self.rows(lang), 1)
+
+    def emoji_char_ratio(self, lang: str) -> float:
+        "emoji per character in the tweets of lang with emoji"
+        return self.lang_emoji[lang].num_tokens / max(self.num_chars(lang), 1)
+
+    def num_types(self, lang: str) -> int:
+        "distinct emoji of lang, estimated from its sketch with sketch"
+        if self.sketch:
+            return self.sketches(lang).num_types()
+        table = self.lang_emoji[lang]
+        return self._memo(
+            "num_types", [lang], [], lambda: int(np.count_nonzero(table.token_counts()))
+        )
+
+    def type_token_ratio(self, lang: str) -> float:
+        "distinct emoji per emoji occurrence in lang"
+        return self.num_types(lang) / max(self.lang_emoji[lang].num_tokens, 1)
+
+    def top_emoji_counts(self, lang: str, k: int) -> list[tuple[str, int]]:
+        "the k emoji in the most tweets of lang, duplicates in a tweet counted once"
+        if self.sketch:
+            return self.sketches(lang).top(k)
+        counts = self.doc_counts(lang)
+        top = np.argsort(-counts, kind="stable")[:k]
+        return [(self.vocab[e], int(counts[e])) for e in top[counts[top] > 0]]
+
+    def most_different(self, significant=False, alpha=0.05) -> list[dict]:
+        """
+        every emoji seen, as {emoji, diff, highest}, by decreasing max - min
+        share of tweets across languages, highest being the index of the
+        language with the largest share. significant keeps emoji whose
+        chi-square q-value is below alpha, ranks them by the lower bound of
+        their bootstrap interval and adds low, high and q. With sketch, and
+        not significant, only emoji some language's sketch keeps as heavy are
+        ranked, by their estimated shares
+        """
+        if significant:
+            table = self.difference_table()
+            return [
+                {
+                    "emoji": self.vocab[table.ids[i]],
+                    "diff": float(table.diff[i]),
+                    "highest": int(table.argmax[i]),
+                    "low": float(table.low[i]),
+                    "high": float(table.high[i]),
+                    "q": float(table.q[i]),
+                }
+                for i in table.order("low", alpha)
+            ]
+        # proportion of tweets containing each emoji, one row per language
+        props = np.zeros((len(self.langs), len(self.vocab)))
+        for i, lang in enumerate(self.langs):
+            total_tweets = len(self.lang_emoji[lang])
+            if total_tweets > 0:
+                counts = (
+                    self.sketch_counts(lang) if self.sketch else self.doc_counts(lang)
+                )
+                props[i] = counts / total_tweets
+        seen = np.flatnonzero(props.max(axis=0) > 0)
+        diff = props.max(axis=0) - props.min(axis=0)
+        highest = props.argmax(axis=0)
+        order = seen[np.argsort(-diff[seen], kind="stable")]
+        return [
+            {"emoji": self.vocab[e], "diff": float(diff[e]), "highest": int(highest[e])}
+            for e in order
+        ]
+
+    @instrument.timed
+    def _savefig(self, name: str, **kwargs) -> None:
+        "saves the current figure as graph_dir/name, timed as rendering"
+        import matplotlib.pyplot as plt
+
+        with instrument.span("render", file=name):
+            plt.savefig(f"./{self.graph_dir}/{name}", **kwargs)
+
+    @instrument.timed
     def percent_with_emoji(self) -> None:
         "processes and displays the percent of tweets with emoji in each language"
-        y = np.empty(len(self.lang_data))
-        for i, lang in enumerate(self.lang_data):
-            y[i] = len(self.lang_emoji[lang]) / self.size
+        import matplotlib.pyplot as plt
+
+        y = [self.share_with_emoji(lang) for lang in self.langs]
         plt.figure()
         plt.title("Percent of tweets containing any emoji")
         plt.bar_label(plt.bar(self.labels, y))
-        plt.savefig(f"./{self.graph_dir}/percent_with_emoji.png")
+        self._savefig("percent_with_emoji.png")
         plt.show()
 
-    def percent_with_specific_emoji(self, input: str) -> np.ndarray:
+    @instrument.timed
+    def percent_with_specific_emoji(
+        self, input: str, fold_skin_tone=False
+    ) -> np.ndarray:
         "processes and displays the percent of tweets with a specific emoji in each language"
+        import matplotlib.pyplot as plt
 
         if not emoji.is_emoji(input):
             print("Failed. Please input a single Unicode emoji character.")
 
-        counts = np.empty(len(self.langs))
-        y = np.empty(len(self.langs))
-
-        for i, lang in enumerate(self.langs):
-            count = 0
-            for x, _ in tqdm(self.lang_emoji[lang]):
-                if input in x:
-                    count += 1
-            counts[i] = count
-            y[i] = count / len(self.lang_emoji[lang])
+        counts = self.specific_emoji_counts([input], fold_skin_tone)
 
         print(counts)
         plt.figure()
         plt.title(f"Number of tweets containing {input}")
         plt.bar_label(plt.bar(self.labels, counts))
-        plt.savefig(
-            f"./{self.graph_dir}/specific/percent_with_{self.emoji_name(input)}"
-        )
+        self._savefig(f"specific/percent_with_{self.emoji_name(input)}")
         plt.show()
         return counts
 
+    @instrument.timed
+    def specific_emoji_counts(self, emojis: list[str], fold_skin_tone=False):
+        "number of tweets containing every emoji in emojis, in each language"
+
+        def compute():
+            counts = np.empty(len(self.langs))
+            for i, lang in enumerate(self.langs):
+                index = self.lang_index[lang]
+                counts[i] = len(index.tweets_with_all(emojis, fold_skin_tone))
+            return counts
+
+        args = [list(emojis), fold_skin_tone]
+        return self._memo("specific_emoji_counts", self.langs, args, compute)
+
     def emoji_name(self, text: str) -> str:
         "takes in an emoji and returns the name, stripped of skin_tone"
-        if not emoji.is_emoji(text):
-            return text
-        text = emoji.demojize(text)
-        text = re.sub(
-            r"(_(light|medium-light|medium|medium-dark|dark)_skin_tone)", "", text
+        return emoji_names.emoji_name(text)
+
+    @instrument.timed
+    def category_table(self, categories=None) -> emoji_categories.CategoryTable:
+        "tweets hitting every category in every language, counted in one pass each"
+        if categories is None:
+            categories = emoji_categories.DEFAULT_CATEGORIES
+
+        def members():
+            matrix = emoji_categories.lookup_matrix(self.names, categories)
+            return {
+                lang: emoji_categories.membership(self.lang_emoji[lang], matrix)
+                for lang in self.langs
+            }
+
+        computed = []
+
+        def compute():
+            computed.append(
+                emoji_categories.CategoryTable(self.langs, list(categories), members())
+            )
+            return computed[0].counts, computed[0].totals
+
+        # a string category names a CSV, whose contents are what the counts follow
+        args = {c: File(v) if isinstance(v, str) else v for c, v in categories.items()}
+        counts, totals = self._memo("category_table", self.langs, [args], compute)
+        if computed:
+            return computed[0]
+        # the counts were stored, membership is only worked out if it is used
+        return emoji_categories.CategoryTable.from_counts(
+            self.langs, list(categories), counts, totals, members
         )
-        return text[1:-1]
 
+    @instrument.timed
+    def cooccurrence(self, lang: str) -> Cooccurrence:
+        "emoji co-occurrence of lang, read from the cache until its table changes"
+        if lang not in self.lang_cooc:
+            emojis = self.vocab.emojis
+            table = self.lang_emoji[lang]
+            arrays = emoji_cache.read_derived(self.cache_dir, lang, "cooc", emojis)
+            if arrays is not None and int(arrays["tweets"]) != len(table):
+                arrays = None  # made from the whole cache or a shorter table of it
+            instrument.count("derived_misses" if arrays is None else "derived_hits")
+            if arrays is None:
+                cooc = Cooccurrence.from_table(table)
+                emoji_cache.write_derived(
+                    self.cache_dir, lang, "cooc", emojis[: cooc.size], cooc.to_arrays()
+                )
+            else:
+                cooc = Cooccurrence.from_arrays(self.vocab, arrays)
+            self.lang_cooc[lang] = cooc
+        return self.lang_cooc[lang]
+
+    @instrument.timed
+    def sketches(self, lang: str) -> EmojiSketch:
+        """
+        sketch of lang, made a shard of chunk_size tweets at a time as a
+        streaming run would. Kept in memory, adding only tweets extracted since
+        """
+        key = (lang, tuple(sorted(self.sketch_args.items())))
+        table = self.lang_emoji[lang]
+        sketch, tweets = self.lang_sketch.get(key, (None, 0))
+        if sketch is None or tweets > len(table):
+            sketch, tweets = EmojiSketch(**self.sketch_args), 0
+        for s in range(tweets, len(table), self.chunk_size):
+            sketch.update(
+                table.take(np.arange(s, min(s + self.chunk_size, len(table))))
+            )
+        self.lang_sketch[key] = (sketch, len(table))
+        return sketch
+
+    def sketch_counts(self, lang: str) -> np.ndarray:
+        """
+        estimated tweets of lang containing each emoji that the sketch of any
+        language keeps as heavy, by vocabulary id, 0 for every other emoji
+        """
+        heavy = {
+            e for other in self.langs for e in self.sketches(other).top_docs.counts
+        }
+        emojis = sorted(heavy)
+        counts = np.zeros(len(self.vocab), dtype=np.int64)
+        counts[[self.vocab.get(e) for e in emojis]] = self.sketches(lang).estimate(
+            emojis
+        )
+        return counts
+
+    @instrument.timed
+    def compare_neighbors(self, e: str, k=10, measure="npmi", min_count=5) -> None:
+        "prints the k emoji most associated with e in each language"
+        print(f"Top {k} neighbors of {e} by {measure}")
+        neighbors = {}
+        for i, lang in enumerate(self.langs):
+            cooc = self.cooccurrence(lang)
+            neighbors[lang] = cooc.neighbors(e, k, measure, min_count)
+            row = " ".join(f"{n} {v:.2f}" for n, v in neighbors[lang])
+            print(f"{self.labels[i]}: {row}")
+        for i, a in enumerate(self.langs):
+            for b in self.langs[i + 1 :]:
+                set_a = {n for n, _ in neighbors[a]}
+                set_b = {n for n, _ in neighbors[b]}
+                shared = len(set_a & set_b) / max(len(set_a | set_b), 1)
+                print(f"{a}/{b} overlap: {shared:.2f}")
+
+    @instrument.timed
+    def least_shared_neighbors(
+        self, n=10, k=10, measure="npmi", min_count=5, langs=None
+    ) -> None:
+        "prints the n emoji whose top k neighbors differ most between two languages"
+        a, b = langs if langs else self.langs[:2]
+        ids, overlaps = neighbor_overlap(
+            self.cooccurrence(a), self.cooccurrence(b), k, measure, min_count
+        )
+        for i in np.argsort(overlaps, kind="stable")[:n]:
+            e = self.vocab[ids[i]]
+            print(f"{e} {self.emoji_name(e)}: {overlaps[i]:.2f}")
+
+    @instrument.timed
     def handshape_emoji(self) -> None:
         "returns chart with percent of handshape emoji"
+        self.category_emoji("handshape", "handshape_emoji.csv")
+
+    @instrument.timed
+    def category_emoji(self, name: str, category) -> None:
+        "returns chart with percent of tweets containing emoji of a category"
+        import matplotlib.pyplot as plt
 
-        handshape_emoji = []
-        file = "handshape_emoji.csv"
         try:
-            with open(file, "r", newline="") as f:
-                reader = csv.reader(f)
-                handshape_emoji = next(reader)
+            y = self.category_table({name: category}).share(name)
         except FileNotFoundError:
-            print(f"CSV file {file} not found")
+            print(f"CSV file {category} not found")
             return
 
-        handshape_emoji = set(handshape_emoji)
-
-        y = np.zeros(len(self.langs))
-        for i, lang in enumerate(self.langs):
-            count = 0
-            for emojis, _ in self.lang_emoji[lang]:
-                emojis = [self.emoji_name(item) for item in emojis]
-                emojis = set(emojis)
-                common = emojis.intersection(handshape_emoji)
-                if common:
-                    count += 1
-            y[i] = count / len(self.lang_emoji[lang])
-
         fig, axs = plt.subplots(1, len(self.langs))
         if len(self.langs) == 1:
             axs = [axs]
@@ -195,75 +644,101 @@ class Data:
             )
             ax.set_title(self.labels[i])
 
-        plt.suptitle("Percent of tweets with emoji containing handshape emoji")
-        plt.savefig(f"./{self.graph_dir}/percent_with_handshape_emoji.png")
+        plt.suptitle(f"Percent of tweets with emoji containing {name} emoji")
+        self._savefig(f"percent_with_{name}_emoji.png")
         plt.show()
 
+    @instrument.timed
     def top_emoji(self, k: int) -> None:
         "plots the top k emoji in each language"
+        import matplotlib.pyplot as plt
 
         fig, axs = plt.subplots(1, len(self.langs))
         for i, ax in enumerate(axs):
             ax.set_title(f"Top {k} {self.labels[i]} Emoji")
 
         for i, lang in enumerate(self.langs):
-            emoji_counter = Counter()
-            for emojis, _ in self.lang_emoji[lang]:
-                unique_emojis = set(emojis)  # remove duplicates in each item
-                emoji_counter.update(unique_emojis)
-
-            most_common = emoji_counter.most_common(k)
+            most_common = self.top_emoji_counts(lang, k)
             print(most_common)
             x, y = zip(*most_common)
             axs[i].bar(x, y)
 
-        plt.savefig(f"./{self.graph_dir}/top_{k}_emoji.png")
+        self._savefig(f"top_{k}_emoji.png")
         plt.show()
 
+    @instrument.timed
     def emoji_per_character(self) -> None:
         "displays a chart of the emoji per character in each language"
+        import matplotlib.pyplot as plt
 
-        y = np.zeros(len(self.langs))
-        for i, lang in enumerate(self.langs):
-            num_emoji = 0
-            num_char = 0
-            for emojis, idx in self.lang_emoji[lang]:
-                num_emoji += len(emojis)
-                num_char += len(self.lang_data[lang][idx])
-            y[i] = num_emoji / num_char
-
+        y = [self.emoji_char_ratio(lang) for lang in self.langs]
         plt.figure()
         plt.title("Emoji per character in tweets containing emoji")
         plt.bar_label(plt.bar(self.labels, y, color=self.colors))
-        plt.savefig(f"./{self.graph_dir}/emoji_per_character.png")
+        self._savefig("emoji_per_character.png")
         plt.show()
 
+    @instrument.timed
     def type_token_analysis(self) -> None:
         "processes and displays the type-token ratio of emoji in each language"
+        import matplotlib.pyplot as plt
 
-        y = np.zeros(len(self.langs))
-        counts = np.zeros(len(self.langs))
-        for i, lang in enumerate(self.langs):
-            tokens = 0
-            types = set()
-            for emojis, _ in self.lang_emoji[lang]:
-                tokens += len(emojis)
-                types.update(emojis)
-            counts[i] = len(types)
-
-            if tokens > 0:
-                y[i] = len(types) / tokens
-            else:
-                y[i] = 0
-
+        y = [self.type_token_ratio(lang) for lang in self.langs]
         plt.figure()
         plt.title("Type-Token Ratio of Emoji")
         plt.bar_label(plt.bar(self.labels, y))
-        plt.savefig(f"./{self.graph_dir}/type_token_ratio.png")
+        self._savefig("type_token_ratio.png")
         plt.show()
 
-    def collect_type_data(self, lang: str, n=10, file=None) -> tuple[int, int, int]:
-        "enters user into a manual referential/pragmatic gesture coding portal"
+    def annotation_store(self) -> AnnotationStore:
+        "the annotation store, opened on first use"
+        if self.store is None:
+            self.store = AnnotationStore(self.annotations)
+        return self.store
+
+    def import_type_csvs(self, langs=None) -> None:
+        "copies the labels of legacy types/<lang>/types_N.csv files into the store"
+        store = self.annotation_store()
+        for lang in langs or self.langs:
+            # coded tweets always have emoji, so only their text is looked up
+            indices = np.asarray(self.lang_emoji[lang].indices)
+            texts_to_index = {}
+            for start in range(0, len(indices), self.chunk_size):
+                chunk = indices[start : start + self.chunk_size]
+                texts = self.lang_data[lang][chunk.tolist()]
+                texts_to_index.update(zip(texts.tolist(), chunk.tolist()))
+            added, missing = store.import_csvs(lang, texts_to_index)
+            print(f"{lang}: imported {added} labels, {missing} tweets not found")
+
+    def sampler(self, lang: str, seed=None, exclude_coded=True) -> Sampler:
+        "draws tweets of lang without replacement, skipping coded ones by default"
+        coded = read_coded(lang) if exclude_coded else ()
+        exclude = self.annotation_store().coded(lang) if exclude_coded else ()
+        return Sampler(
+            self.lang_emoji[lang],
+            self.lang_index[lang],
+            self.lang_data[lang],
+            self.names,
+            seed,
+            coded,
+            exclude,
+        )
+
+    def collect_type_data(
+        self,
+        lang: str,
+        n=10,
+        file=None,
+        emoji=None,
+        category=None,
+        seed=None,
+        coder=None,
+    ) -> tuple[int, int, int]:
+        """
+        enters user into a manual referential/pragmatic gesture coding portal,
+        showing n uncoded tweets, only ones with emoji or category if given.
+        Each label is saved to the annotation store as soon as it is entered
+        """
         counts = {"p": 0, "r": 0, "n": 0}
         if file:
             file = f"types/{lang}/types_{file}.csv"
@@ -278,35 +753,38 @@ class Data:
             except FileNotFoundError:
                 print(f"CSV file {file} not found")
 
+        store = self.annotation_store()
+        coder = coder or getpass.getuser()
+        sample = self.sampler(lang, seed).sample(n, emoji=emoji, category=category)
+        if len(sample) < n:
+            print(f"Only {len(sample)} uncoded tweets to show")
         print("Input 'p' for pragmatic and 'r' for referential")
 
-        types = []
-        for i in range(n):
-            idx = randrange(len(self.lang_emoji[lang]))
-            data = self.lang_data[lang]
-            emojis = self.lang_emoji[lang]
-            entry = emojis[idx][1]
+        data = self.lang_data[lang]
+        for i, entry in enumerate(sample.tolist()):
             print("-" * 10, i + 1, "-" * 10)
             print(data[entry])
             type_input = input()
             valid = ["p", "r", "n"]
             if type_input and all(char in valid for char in type_input):
-                types.append((data[entry], type_input))
-                for char in type_input:
-                    counts[char] += 1
+                if store.add(lang, entry, coder, type_input):
+                    for char in type_input:
+                        counts[char] += 1
+                else:
+                    print(f"Already coded by {coder}")
             else:
                 print("Invalid input")
 
-        num = len(os.listdir("types")) + 1
-        file = f"types/{lang}/types_{num}.csv"
-        with open(file, "w", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerows(types)
-
         return (counts["p"], counts["r"], counts["n"])
 
-    def plot_type_data(self, num=10, files=[0, 0]) -> None:
-        "takes data collected by collect_type_data and plots it per language"
+    @instrument.timed
+    def plot_type_data(self, num=10, files=[0, 0], coder=None) -> None:
+        """
+        runs a coding session of num tweets per language, then plots every
+        label in the annotation store, or the legacy CSV files if given
+        """
+        import matplotlib.pyplot as plt
+
         categories = ("Pragmatic", "Referential", "Neither")
         x = np.arange(len(categories))  # the label locations
         width = 0.25  # the width of the bars
@@ -316,8 +794,13 @@ class Data:
 
         for i, lang in enumerate(self.langs):
             file_val = files[i] if i < len(files) else 0
-            (p, r, n) = self.collect_type_data(lang, n=num, file=file_val)
-            measurement = (p, r, n)
+            if file_val:
+                measurement = self.collect_type_data(lang, file=file_val)
+            else:
+                if num:
+                    self.collect_type_data(lang, n=num, coder=coder)
+                counts = self.annotation_store().type_counts(lang)
+                measurement = (counts["p"], counts["r"], counts["n"])
 
             offset = width * multiplier
             rects = ax.bar(x + offset, measurement, width, label=self.labels[i])
@@ -330,36 +813,149 @@ class Data:
         ax.set_xticklabels(categories)
         ax.legend(loc="upper right")
 
-        plt.savefig(f"./{self.graph_dir}/type_data.png")
+        self._savefig("type_data.png")
         plt.show()
 
-    def get_most_different(self, k) -> None:
-        "plots the k emoji with most proportional difference across all languages"
-        emoji_proportions = {}
-        all_emojis = set()
-
+    @instrument.timed
+    def type_by_category(self, categories=None, coder=None) -> dict[str, np.ndarray]:
+        """
+        labels containing each type (columns p, r, n) among the coded tweets of
+        each category (rows), per language, joined through the tweet index
+        """
+        if categories is None:
+            categories = emoji_categories.DEFAULT_CATEGORIES
+        matrix = emoji_categories.lookup_matrix(self.names, categories)
+        store = self.annotation_store()
+        output = {}
         for lang in self.langs:
-            counts = Counter()
-            for emojis, _ in self.lang_emoji[lang]:
-                counts.update(set(emojis))
+            table = self.lang_emoji[lang]
+            tweets, labels = store.labels(lang, coder)
+            rows = join_rows(table, tweets)
+            found = rows >= 0
+            coded = table.take(rows[found])
+            members = emoji_categories.membership(coded, matrix)
+            types = type_matrix([l for l, f in zip(labels, found) if f])
+            output[lang] = members.T.astype(np.int64) @ types.reshape(-1, len(TYPES))
+        return output
 
-            total_tweets = len(self.lang_emoji[lang])
-            if total_tweets > 0:
-                emoji_proportions[lang] = {
-                    e: count / total_tweets for e, count in counts.items()
-                }
+    def days(self, lang: str) -> np.ndarray | None:
+        "day since 1970 of each row of lang up to size, None if it has no dates"
+        from arrow_text import read_days
+
+        days = read_days(self.paths[lang])
+        if days is None:
+            return None
+        return days[: min(len(days), self.size)]
+
+    @instrument.timed
+    def trends(self, lang: str, period="month", categories=None) -> "TrendTable":
+        """
+        per-period counts of lang over every extracted tweet. Kept in memory,
+        and when the table has grown since, only the new tweets are added
+        """
+        from emoji_trends import TrendTable
+
+        if categories is None:
+            categories = emoji_categories.DEFAULT_CATEGORIES
+        # keyed on what each category holds, so a redefined one is recounted
+        matrix = emoji_categories.lookup_matrix(self.names, categories)
+        key = (lang, period, tuple(categories), matrix.shape, matrix.tobytes())
+        table = self.lang_emoji[lang]
+        trends, tweets, rows = self.lang_trends.get(key, (None, 0, 0))
+        if trends is not None and tweets == len(table):
+            return trends
+        days = self.days(lang)
+        if days is None:
+            raise ValueError(f"{self.paths[lang]} has no date column, run ingest.py")
+        # extraction only appends, so the new tweets are the end of the table,
+        # unless it was replaced by one with tweets among the rows counted
+        new = table.take(np.arange(tweets, len(table)))
+        if tweets > len(table) or (len(new) and new.indices[0] < rows):
+            trends = None
+        if trends is None:
+            trends = TrendTable(period, list(categories), matrix)
+            tweets = rows = 0
+            new = table
+        trends.add(new, days[rows:], rows, matrix)
+        self.lang_trends[key] = (trends, len(table), len(days))
+        return trends
+
+    @instrument.timed
+    def plot_trend(self, e=None, category=None, period="month", window=1) -> None:
+        """
+        plots, per period and language, the share of tweets with emoji that
+        contain e or an emoji of category, or else the percent of tweets with
+        any emoji, summed over a rolling window of periods if window > 1
+        """
+        import matplotlib.pyplot as plt
+
+        fig, ax = plt.subplots()
+        for i, lang in enumerate(self.langs):
+            try:
+                trends = self.trends(lang, period)
+            except ValueError as error:
+                print(error)
+                continue
+            if e is not None:
+                y = trends.frequency([self.vocab.get(e)], window)[:, 0]
+            elif category is not None:
+                y = trends.category_shares(window)[:, trends.categories.index(category)]
             else:
-                emoji_proportions[lang] = {}
-            all_emojis.update(counts.keys())
+                y = trends.percent_with_emoji(window)
+            x = np.arange(trends.start, trends.start + len(trends))
+            ax.plot(x.astype(f"datetime64[{trends.unit}]"), y, color=self.colors[i])
+            ax.lines[-1].set_label(self.labels[i])
+        ax.set_title(
+            f"Share of tweets with {e or category or 'any emoji'} per {period}"
+        )
+        ax.legend(loc="upper right")
+        fig.autofmt_xdate()
+        name = self.emoji_name(e) if e else category or "any"
+        self._savefig(f"trend_{name}_{period}.png")
+        plt.show()
 
-        diffs = []
-        for emoji_char in all_emojis:
-            props = [emoji_proportions[lang].get(emoji_char, 0) for lang in self.langs]
-            diff = max(props) - min(props)
-            max_idx = props.index(max(props))
-            diffs.append((emoji_char, diff, max_idx))
+    @instrument.timed
+    def difference_table(
+        self, replicates=1000, workers=None, method="binomial"
+    ) -> emoji_stats.DifferenceTable:
+        "tests and bootstrap intervals of every emoji's difference across languages"
+
+        def compute():
+            counts = np.zeros((len(self.langs), len(self.vocab)), dtype=np.int64)
+            for i, lang in enumerate(self.langs):
+                counts[i] = self.doc_counts(lang)[: len(self.vocab)]
+            totals = np.array([len(self.lang_emoji[lang]) for lang in self.langs])
+            return emoji_stats.DifferenceTable(
+                self.langs,
+                np.flatnonzero(counts.max(axis=0) > 0),
+                counts,
+                totals,
+                replicates=replicates,
+                workers=workers or self.workers,
+                method=method,
+            )
 
-        diffs.sort(key=lambda item: item[1], reverse=True)
+        # the bootstrap is seeded and split the same way for any workers
+        args = [replicates, method]
+        return self._memo("difference_table", self.langs, args, compute)
+
+    @instrument.timed
+    def get_most_different(self, k, significant=False, alpha=0.05) -> None:
+        """
+        plots the k emoji with most proportional difference across all languages,
+        k at a time, ranked as by most_different, with the bootstrap interval
+        drawn if significant
+        """
+        import matplotlib as mpl
+        import matplotlib.pyplot as plt
+
+        rows = self.most_different(significant, alpha)
+        diffs = [(row["emoji"], row["diff"], row["highest"]) for row in rows]
+        errors = None
+        if significant:
+            errors = [
+                (row["diff"] - row["low"], row["high"] - row["diff"]) for row in rows
+            ]
 
         fig, ax = plt.subplots()
         colors = [f"C{i}" for i in range(len(self.langs))]
@@ -384,8 +980,12 @@ class Data:
             color_indices = [item[2] for item in current_data]
             bar_colors = [colors[i] for i in color_indices]
 
+            yerr = None
+            if errors is not None:
+                yerr = np.array(errors[idx : idx + len(current_data)]).T
+
             ax.clear()
-            bars = ax.bar(x, y, color=bar_colors)
+            bars = ax.bar(x, y, color=bar_colors, yerr=yerr)
             ax.bar_label(bars)
             ax.set_title(
                 f"Top {k} Different Emoji (Rank {idx + 1}-{idx + len(current_data)})"
@@ -401,14 +1001,17 @@ class Data:
         update()
         fig.canvas.mpl_connect("button_press_event", update)
 
-        plt.savefig(f"./{self.graph_dir}/top_{k}_emoji.png")
+        self._savefig(f"top_{k}_emoji.png")
         plt.show()
 
-    def plot_multiple_specific(self, specific: list[str]) -> None:
+    @instrument.timed
+    def plot_multiple_specific(self, specific: list[str], fold_skin_tone=False) -> None:
         "plots multiple specific emoji in the same image"
+        import matplotlib.pyplot as plt
+
         counts_list = []
         for em in specific:
-            counts_list.append(self.percent_with_specific_emoji(em))
+            counts_list.append(self.specific_emoji_counts([em], fold_skin_tone))
 
         fig, axs = plt.subplots(1, len(specific))
         if len(specific) == 1:
@@ -421,7 +1024,7 @@ class Data:
 
         names = [self.emoji_name(em) for em in specific]
         plt.tight_layout()
-        plt.savefig(f"./{self.graph_dir}/specific_{'_'.join(names)}.png", dpi=400)
+        self._savefig(f"specific_{'_'.join(names)}.png", dpi=400)
         plt.show()
 
 
@@ -0,0 +1,196 @@
+import argparse
+import json
+import numpy as np
+import os
+
+import emoji_cache
+from emoji_table import EmojiIndex, EmojiTable, Vocabulary
+
+
+class Query:
+    """
+    Emoji counts and percentages per language, answered from the extraction
+    caches alone, without importing datasets, matplotlib or the tokenizer.
+    A language is opened the first time it is asked about, and only the
+    arrays the question needs are memory-mapped. Per-emoji tweet and token
+    counts are kept in the cache as a derived result, so later questions
+    read a few small arrays. The caches are taken as they are: Data checks
+    them against the datasets and rebuilds them when they go stale.
+    """
+
+    def __init__(self, cache_dir="cache", registry="../registry.json") -> None:
+        self.cache_dir = cache_dir
+        self.vocab = Vocabulary(emoji_cache.load_vocab(cache_dir))
+        self.langs, self.labels = self._languages(registry)
+        self._stats = {}
+        self._index = {}
+
+    def _languages(self, registry: str) -> tuple[list[str], list[str]]:
+        "languages and labels of the registry, or every language with a cache"
+        try:
+            with open(registry, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            langs = list(entries)
+            return langs, [entries[lang]["label"] for lang in langs]
+        except FileNotFoundError:
+            pass
+        try:
+            langs = sorted(
+                lang
+                for lang in os.listdir(self.cache_dir)
+                if os.path.exists(os.path.join(self.cache_dir, lang, "meta.json"))
+            )
+        except FileNotFoundError:
+            langs = []
+        return langs, langs
+
+    def _read(self, lang: str, names) -> dict:
+        loaded = emoji_cache.read_arrays(self.cache_dir, lang, self.vocab.emojis, names)
+        if loaded is None:
+            raise FileNotFoundError(
+                f"No usable cache for {lang} in {self.cache_dir}, run Data() first"
+            )
+        arrays, meta = loaded
+        arrays["rows"] = meta["rows"]
+        return arrays
+
+    def stats(self, lang: str) -> dict:
+        "rows, tweets with emoji, and tweets and tokens of each emoji id in lang"
+        if lang not in self._stats:
+            emojis = self.vocab.emojis
+            stats = emoji_cache.read_derived(self.cache_dir, lang, "stats", emojis)
+            if stats is None:
+                arrays = self._read(lang, emoji_cache.REQUIRED)
+                table = EmojiTable(
+                    self.vocab, arrays["ids"], arrays["offsets"], arrays["indices"]
+                )
+                stats = {
+                    "rows": np.array(arrays["rows"]),
+                    "tweets": np.array(len(table)),
+                    "doc_counts": table.doc_counts(),
+                    "token_counts": table.token_counts(),
+                }
+                emoji_cache.write_derived(self.cache_dir, lang, "stats", emojis, stats)
+            self._stats[lang] = stats
+        return self._stats[lang]
+
+    def index(self, lang: str) -> EmojiIndex:
+        "inverted index of lang, memory-mapped from the cache"
+        if lang not in self._index:
+            arrays = self._read(lang, ("postings", "postings_offsets"))
+            if "postings" in arrays:
+                index = EmojiIndex(
+                    self.vocab, arrays["postings"], arrays["postings_offsets"]
+                )
+            else:
+                # checkpointed parts are not merged yet, so the table is complete
+                # but the stored index is not
+                table = EmojiTable(
+                    self.vocab, arrays["ids"], arrays["offsets"], arrays["indices"]
+                )
+                index = EmojiIndex.from_table(table)
+            self._index[lang] = index
+        return self._index[lang]
+
+    def _codes(self, emoji: str, fold_skin_tone: bool) -> list[int]:
+        if fold_skin_tone:
+            return self.vocab.skin_tone_variants(emoji)
+        code = self.vocab.get(emoji)
+        return [code] if code >= 0 else []
+
+    def count(self, lang: str, emoji: str, fold_skin_tone=False, tokens=False) -> int:
+        "tweets of lang containing emoji, or occurrences of it if tokens"
+        stats = self.stats(lang)
+        codes = self._codes(emoji, fold_skin_tone)
+        counts = stats["token_counts"] if tokens else stats["doc_counts"]
+        if tokens or len(codes) <= 1:
+            # ids added to the vocabulary after the stats were taken have no tweets
+            return int(sum(counts[c] for c in codes if c < len(counts)))
+        # skin tones of one tweet would be counted twice by adding doc counts
+        return len(self.index(lang).tweets_with_ids(codes))
+
+    def count_category(self, lang: str, category) -> int:
+        "tweets of lang with any emoji of category, a DEFAULT_CATEGORIES name"
+        import emoji_categories
+        import emoji_names
+
+        if isinstance(category, str):
+            category = emoji_categories.DEFAULT_CATEGORIES.get(category, category)
+        names = emoji_names.NameTable(self.vocab)
+        matrix = emoji_categories.lookup_matrix(names, {"": category})
+        return len(self.index(lang).tweets_with_ids(np.flatnonzero(matrix[:, 0])))
+
+    def percent(self, lang: str, count: int, of="rows") -> float:
+        "count as a percentage of every cached tweet of lang, or of those with emoji"
+        total = int(self.stats(lang)["rows" if of == "rows" else "tweets"])
+        return 100 * count / max(total, 1)
+
+    def top(self, lang: str, k=10) -> list[tuple[str, int]]:
+        "the k emoji in the most tweets of lang"
+        counts = self.stats(lang)["doc_counts"]
+        top = np.argsort(-counts, kind="stable")[:k]
+        return [(self.vocab[e], int(counts[e])) for e in top if counts[e] > 0]
+
+    def summary(self, lang: str) -> dict:
+        stats = self.stats(lang)
+        rows, tweets = int(stats["rows"]), int(stats["tweets"])
+        tokens = int(stats["token_counts"].sum())
+        return {
+            "rows": rows,
+            "tweets": tweets,
+            "percent_with_emoji": 100 * tweets / max(rows, 1),
+            "tokens": tokens,
+            "types": int(np.count_nonzero(stats["token_counts"])),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Answer emoji count questions from the extraction caches"
+    )
+    parser.add_argument("--cache", default="cache")
+    parser.add_argument("--registry", default="../registry.json")
+    parser.add_argument("--langs", nargs="+", help="default: every language")
+    parser.add_argument("--json", action="store_true", help="print JSON")
+    commands = parser.add_subparsers(dest="command", required=True)
+    count = commands.add_parser("count", help="tweets containing each emoji")
+    count.add_argument("emojis", nargs="*")
+    count.add_argument("--category", nargs="*", default=[])
+    count.add_argument("--fold-skin-tone", action="store_true")
+    count.add_argument("--tokens", action="store_true", help="count occurrences")
+    top = commands.add_parser("top", help="emoji in the most tweets")
+    top.add_argument("--k", type=int, default=10)
+    commands.add_parser("summary", help="tweets, emoji tokens and types")
+    args = parser.parse_args()
+
+    query = Query(args.cache, args.registry)
+    langs = args.langs or query.langs
+    output = []
+    for lang in langs:
+        if args.command == "count":
+            for e in args.emojis:
+                n = query.count(lang, e, args.fold_skin_tone, args.tokens)
+                output.append([lang, e, n, query.percent(lang, n)])
+            for category in args.category:
+                n = query.count_category(lang, category)
+                output.append([lang, category, n, query.percent(lang, n)])
+        elif args.command == "top":
+            output.extend([lang, e, n] for e, n in query.top(lang, args.k))
+        else:
+            output.append([lang, query.summary(lang)])
+
+    if args.json:
+        print(json.dumps(output, ensure_ascii=False))
+    elif args.command == "count":
+        for lang, key, n, percent in output:
+            print(f"{lang}\t{key}\t{n}\t{percent:.3f}%")
+    elif args.command == "top":
+        for lang, e, n in output:
+            print(f"{lang}\t{e}\t{n}")
+    else:
+        for lang, summary in output:
+            print(lang, "\t".join(f"{k}={v:.4g}" for k, v in summary.items()))
+
+
+if __name__ == "__main__":
+    main()
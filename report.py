@@ -0,0 +1,320 @@
+import matplotlib
+
+# set before anything imports pyplot, so nothing needs a display
+matplotlib.use("Agg")
+
+import argparse
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib.pyplot as plt
+
+import emoji_cache
+import instrument
+from process_data import Data
+
+METRICS = (
+    "percent_with_emoji",
+    "top_emoji",
+    "categories",
+    "emoji_per_character",
+    "type_token_ratio",
+    "most_different",
+    "specific",
+)
+
+
+def compute_metrics(
+    data: Data, metrics=METRICS, k=10, specific=(), significance=False
+) -> dict:
+    """
+    Every requested metric as plain numbers, computed by the same Data methods
+    the interactive plots use. Counts shared by several metrics are computed once.
+    """
+    report = {
+        "metrics": list(metrics),
+        "langs": data.langs,
+        "labels": data.labels,
+        "colors": data.colors,
+    }
+    per_lang = {}
+    for lang in data.langs:
+        table = data.lang_emoji[lang]
+        stats = {
+            "rows": data.rows(lang),
+            "tweets": len(table),
+            "tokens": table.num_tokens,
+            "types": data.num_types(lang),
+            "percent_with_emoji": data.share_with_emoji(lang),
+            "type_token_ratio": data.type_token_ratio(lang),
+        }
+        if "emoji_per_character" in metrics:
+            stats["chars"] = data.num_chars(lang)
+            stats["emoji_per_character"] = data.emoji_char_ratio(lang)
+        if "top_emoji" in metrics:
+            stats["top_emoji"] = [list(e) for e in data.top_emoji_counts(lang, k)]
+        per_lang[lang] = stats
+    report["languages"] = per_lang
+
+    if "categories" in metrics:
+        categories = data.category_table()
+        report["categories"] = {
+            "names": categories.categories,
+            "counts": categories.counts.tolist(),
+            "totals": categories.totals.tolist(),
+            "shares": categories.shares().tolist(),
+        }
+    if "most_different" in metrics:
+        report["most_different"] = data.most_different(significance)[:k]
+    if "specific" in metrics and specific:
+        report["specific"] = {
+            e: data.specific_emoji_counts([e]).tolist() for e in specific
+        }
+    return report
+
+
+def _save(fig, path: str, formats) -> list[str]:
+    files = []
+    for fmt in formats:
+        files.append(f"{path}.{fmt}")
+        fig.savefig(files[-1])
+    plt.close(fig)
+    return files
+
+
+def _bar_chart(report: dict, key: str, title: str, path: str, formats) -> list[str]:
+    "one bar per language of report['languages'][lang][key]"
+    y = [report["languages"][lang][key] for lang in report["langs"]]
+    fig, ax = plt.subplots()
+    ax.set_title(title)
+    ax.bar_label(ax.bar(report["labels"], y, color=report["colors"]))
+    return _save(fig, path, formats)
+
+
+def _top_emoji(report: dict, path: str, formats) -> list[str]:
+    fig, axs = plt.subplots(1, len(report["langs"]), squeeze=False)
+    for ax, lang, label in zip(axs[0], report["langs"], report["labels"]):
+        top = report["languages"][lang]["top_emoji"]
+        ax.set_title(f"Top {len(top)} {label} Emoji")
+        if top:
+            x, y = zip(*top)
+            ax.bar(x, y)
+    return _save(fig, path, formats)
+
+
+def _category(report: dict, j: int, path: str, formats) -> list[str]:
+    "pie chart per language of the share of tweets hitting category j"
+    name = report["categories"]["names"][j]
+    fig, axs = plt.subplots(1, len(report["langs"]), squeeze=False)
+    for i, ax in enumerate(axs[0]):
+        share = report["categories"]["shares"][i][j]
+        ax.pie(
+            [share, 1 - share],
+            colors=[report["colors"][i], "lightgray"],
+            autopct="%1.1f%%",
+        )
+        ax.set_title(report["labels"][i])
+    fig.suptitle(f"Percent of tweets with emoji containing {name} emoji")
+    return _save(fig, path, formats)
+
+
+def _most_different_chart(report: dict, path: str, formats) -> list[str]:
+    rows = report["most_different"]
+    fig, ax = plt.subplots()
+    ax.set_title(f"Top {len(rows)} Different Emoji")
+    colors = [f"C{row['highest']}" for row in rows]
+    yerr = None
+    if rows and "low" in rows[0]:
+        yerr = [
+            [r["diff"] - r["low"] for r in rows],
+            [r["high"] - r["diff"] for r in rows],
+        ]
+    bars = ax.bar(
+        [r["emoji"] for r in rows], [r["diff"] for r in rows], color=colors, yerr=yerr
+    )
+    ax.bar_label(bars)
+    handles = [
+        matplotlib.patches.Rectangle((0, 0), 1, 1, color=f"C{i}")
+        for i in range(len(report["langs"]))
+    ]
+    ax.legend(handles, report["labels"], loc="upper right")
+    return _save(fig, path, formats)
+
+
+def _specific(report: dict, path: str, formats) -> list[str]:
+    emojis = list(report["specific"])
+    fig, axs = plt.subplots(1, len(emojis), squeeze=False)
+    for ax, e in zip(axs[0], emojis):
+        ax.set_title(f"Number of {e}")
+        ax.bar_label(
+            ax.bar(report["labels"], report["specific"][e], color=report["colors"])
+        )
+    fig.tight_layout()
+    return _save(fig, path, formats)
+
+
+def _first(report: dict) -> dict:
+    "stats of the first language, which has every per-language metric computed"
+    return report["languages"][report["langs"][0]] if report["langs"] else {}
+
+
+def figure_jobs(report: dict, out_dir: str) -> list[tuple]:
+    "(function, args) of every figure the report has the numbers for"
+    jobs = []
+    bars = {
+        "percent_with_emoji": "Percent of tweets containing any emoji",
+        "emoji_per_character": "Emoji per character in tweets containing emoji",
+        "type_token_ratio": "Type-Token Ratio of Emoji",
+    }
+    first = _first(report)
+    for key, title in bars.items():
+        if key in report["metrics"]:
+            jobs.append((_bar_chart, (key, title, os.path.join(out_dir, key))))
+    if "top_emoji" in first:
+        jobs.append((_top_emoji, (os.path.join(out_dir, "top_emoji"),)))
+    for j, name in enumerate(report.get("categories", {}).get("names", [])):
+        path = os.path.join(out_dir, f"percent_with_{name}_emoji")
+        jobs.append((_category, (j, path)))
+    if "most_different" in report:
+        jobs.append((_most_different_chart, (os.path.join(out_dir, "most_different"),)))
+    if report.get("specific"):
+        jobs.append((_specific, (os.path.join(out_dir, "specific"),)))
+    return jobs
+
+
+def _render(job: tuple, report: dict, formats) -> list[str]:
+    function, args = job
+    return function(report, *args, formats)
+
+
+def render(report: dict, out_dir: str, formats=("png",), workers=1) -> list[str]:
+    "draws every figure with Agg, in a pool of workers processes if more than one"
+    jobs = figure_jobs(report, out_dir)
+    n = len(jobs)
+    if workers > 1 and n > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, n)) as pool:
+            files = pool.map(_render, jobs, [report] * n, [formats] * n)
+            return [f for fs in files for f in fs]
+    return [f for job in jobs for f in _render(job, report, formats)]
+
+
+def write_tables(report: dict, out_dir: str) -> None:
+    "writes the numbers behind the figures as metrics.json and CSV files"
+    emoji_cache.write_json(os.path.join(out_dir, "metrics.json"), report)
+    keys = [
+        "rows",
+        "tweets",
+        "percent_with_emoji",
+        "tokens",
+        "types",
+        "type_token_ratio",
+        "chars",
+        "emoji_per_character",
+    ]
+    with open(os.path.join(out_dir, "summary.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["lang", "label"] + keys)
+        for lang, label in zip(report["langs"], report["labels"]):
+            stats = report["languages"][lang]
+            writer.writerow([lang, label] + [stats.get(key, "") for key in keys])
+    if "top_emoji" in _first(report):
+        with open(os.path.join(out_dir, "top_emoji.csv"), "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["lang", "rank", "emoji", "tweets"])
+            for lang in report["langs"]:
+                for rank, (e, count) in enumerate(
+                    report["languages"][lang]["top_emoji"]
+                ):
+                    writer.writerow([lang, rank + 1, e, count])
+    if "categories" in report:
+        categories = report["categories"]
+        with open(os.path.join(out_dir, "categories.csv"), "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["lang", "category", "count", "total", "share"])
+            for i, lang in enumerate(report["langs"]):
+                for j, name in enumerate(categories["names"]):
+                    writer.writerow(
+                        [
+                            lang,
+                            name,
+                            categories["counts"][i][j],
+                            categories["totals"][i],
+                            categories["shares"][i][j],
+                        ]
+                    )
+    if "most_different" in report:
+        rows = report["most_different"]
+        with open(os.path.join(out_dir, "most_different.csv"), "w", newline="") as f:
+            writer = csv.writer(f)
+            fields = list(rows[0]) if rows else ["emoji", "diff", "highest"]
+            writer.writerow(fields)
+            for row in rows:
+                writer.writerow([row[field] for field in fields])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compute every metric once and render all figures headless"
+    )
+    parser.add_argument("--out", default="report")
+    parser.add_argument("--metrics", nargs="+", choices=METRICS, default=METRICS)
+    parser.add_argument("--formats", nargs="+", default=["png", "svg"])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--specific", nargs="*", default=[])
+    parser.add_argument(
+        "--significance",
+        action="store_true",
+        help="rank by bootstrap interval, and write differences.csv of every test",
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--test", action="store_true", help="use ./test data")
+    parser.add_argument(
+        "--lazy",
+        action="store_true",
+        help="read the extraction caches without loading or checking the datasets",
+    )
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="write trace.json (chrome://tracing) and stages.json to --out",
+    )
+    parser.add_argument("--profile", help="profile every span with this name")
+    parser.add_argument(
+        "--profiler", choices=["cprofile", "pyinstrument"], default="cprofile"
+    )
+    args = parser.parse_args()
+
+    if args.trace or args.profile:
+        instrument.enable(args.profile, args.profiler)
+    start = time.perf_counter()
+    data = Data(test=args.test, lazy=args.lazy)
+    loaded = time.perf_counter()
+    with instrument.span("compute_metrics"):
+        report = compute_metrics(
+            data, args.metrics, args.k, args.specific, args.significance
+        )
+    computed = time.perf_counter()
+    os.makedirs(args.out, exist_ok=True)
+    with instrument.span("write_tables"):
+        write_tables(report, args.out)
+        if args.significance and "most_different" in args.metrics:
+            # every emoji with its chi-square and pairwise z tests, from the cache
+            table = data.difference_table()
+            table.write_csv(os.path.join(args.out, "differences.csv"), data.vocab)
+    with instrument.span("render_all", workers=args.workers):
+        files = render(report, args.out, args.formats, args.workers)
+    done = time.perf_counter()
+    if args.trace:
+        instrument.write_trace(os.path.join(args.out, "trace.json"))
+        instrument.write_json(os.path.join(args.out, "stages.json"))
+    if args.profile:
+        suffix = "prof" if args.profiler == "cprofile" else "html"
+        instrument.write_profile(os.path.join(args.out, f"profile.{suffix}"))
+    print(f"Loaded in {loaded - start:.1f}s, computed in {computed - loaded:.1f}s")
+    print(f"Rendered {len(files)} files to {args.out} in {done - computed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
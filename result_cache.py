@@ -0,0 +1,218 @@
+import hashlib
+import json
+import os
+import pickle
+import time
+import types
+
+import numpy as np
+
+import instrument
+
+# part of every key, raised when a stored result's layout changes
+VERSION = 2
+_MISSING = object()
+
+
+class File(str):
+    "a path argument keyed by the contents of the file it names, not its name"
+
+
+def _file_hash(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _code_hash(code) -> str:
+    "hash of a function's bytecode, constants and names, nested functions included"
+    h = hashlib.sha1(code.co_code)
+    for const in code.co_consts:
+        h.update(
+            (_code_hash(const) if hasattr(const, "co_code") else repr(const)).encode()
+        )
+    h.update(repr(code.co_names).encode())
+    return h.hexdigest()
+
+
+def _global_names(code) -> set[str]:
+    "names code and the functions nested in it may look up as globals"
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if hasattr(const, "co_code"):
+            names |= _global_names(const)
+    return names
+
+
+def _function(function, seen: frozenset):
+    "a function by its code, the values in its closure and the globals it names"
+    code = function.__code__
+    if code in seen:
+        # recursion, the rest of the function is already part of the key
+        return {"code": function.__qualname__}
+    seen = seen | {code}
+    cells = []
+    for cell in function.__closure__ or ():
+        try:
+            cells.append(_canonical(cell.cell_contents, seen))
+        except ValueError:
+            cells.append({"cell": None})  # not assigned yet
+    found = {}
+    for name in sorted(_global_names(code)):
+        if name in function.__globals__:
+            value = function.__globals__[name]
+            if isinstance(value, types.ModuleType):
+                found[name] = {"module": value.__name__}
+            else:
+                found[name] = _canonical(value, seen)
+    return {
+        "code": function.__qualname__,
+        "sha1": _code_hash(code),
+        "closure": cells,
+        "globals": found,
+    }
+
+
+def _canonical(value, seen: frozenset):
+    if isinstance(value, dict):
+        items = sorted((str(k), _canonical(v, seen)) for k, v in value.items())
+        return {"dict": [list(item) for item in items]}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v, seen) for v in value]
+    if isinstance(value, (set, frozenset)):
+        return {"set": sorted(json.dumps(_canonical(v, seen)) for v in value)}
+    if isinstance(value, np.ndarray):
+        array = np.ascontiguousarray(value)
+        digest = hashlib.sha1(array.tobytes()).hexdigest()
+        return {"array": [str(array.dtype), list(array.shape), digest]}
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, File):
+        return {"file": str(value), "sha1": _file_hash(value)}
+    if isinstance(value, types.FunctionType):
+        return _function(value, seen)
+    if isinstance(value, types.BuiltinFunctionType):
+        return {"builtin": f"{value.__module__}.{value.__qualname__}"}
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    raise TypeError(f"Cannot key a result on {type(value).__name__}")
+
+
+def canonical(value):
+    """
+    value as plain JSON that changes whenever what it stands for does: File
+    paths are replaced by a hash of the file's contents, functions by a hash
+    of their code together with their closure and the globals they name, and
+    arrays by a hash of their bytes. Raises TypeError for anything else
+    """
+    return _canonical(value, frozenset())
+
+
+class ResultCache:
+    """
+    Analysis results on disk, addressed by a hash of everything they were
+    computed from. A changed input gives a new key, so stale results are never
+    read, only left to age out: every read touches its file and, once the
+    directory holds more than max_bytes, the least recently used files go.
+    Writes are atomic, so processes can share a directory.
+    """
+
+    def __init__(self, directory: str, max_bytes=256 * 2**20) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def key(self, inputs) -> str:
+        text = json.dumps(canonical([VERSION, inputs]), ensure_ascii=False)
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.pkl")
+
+    def get(self, key: str, default=None):
+        "the result stored under key, or default"
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return default
+        except (EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            # cut short, or pickled from a class that has since moved
+            os.remove(path)
+            return default
+        now = time.time()
+        os.utime(path, (now, now))
+        return value
+
+    def put(self, key: str, value) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        self.evict()
+
+    def memo(self, inputs, compute):
+        """
+        the result of compute(), computed only if nothing is stored for inputs.
+        Inputs that cannot be keyed are never stored, compute() runs every time
+        """
+        try:
+            key = self.key(inputs)
+        except TypeError:
+            instrument.count("result_unkeyed")
+            return compute()
+        value = self.get(key, _MISSING)
+        instrument.count("result_misses" if value is _MISSING else "result_hits")
+        if value is _MISSING:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def entries(self) -> list[tuple[float, int, str]]:
+        "(last use, bytes, path) of every stored result"
+        entries = []
+        try:
+            shards = os.listdir(self.directory)
+        except FileNotFoundError:
+            return entries
+        for shard in shards:
+            shard_dir = os.path.join(self.directory, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for name in os.listdir(shard_dir):
+                if not name.endswith(".pkl"):
+                    continue
+                path = os.path.join(shard_dir, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue  # evicted by another process
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self) -> int:
+        "removes the least recently used results until max_bytes fit, returns how many"
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self) -> None:
+        for _, _, path in self.entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,289 @@
+import argparse
+import json
+import numpy as np
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import emoji_cache
+import emoji_categories
+from emoji_names import NameTable
+from emoji_sketch import EmojiSketch
+from emoji_table import EmojiTable, Vocabulary
+from process_data import _extract_chunk
+
+# rough in-memory cost of one tweet once it is a Python string with its emoji
+# lists, used to turn a memory budget into a batch size
+BYTES_PER_TWEET = 1024
+
+
+def _grow(counts: np.ndarray, size: int) -> np.ndarray:
+    "pads counts with zeros up to size, for ids added to the vocabulary since"
+    return np.pad(counts, (0, size - len(counts)))
+
+
+class StreamStats:
+    """
+    Running aggregates of one language. Their size depends on the vocabulary
+    and the categories only, never on the number of tweets read. Given a
+    sketch, per-emoji counts are kept in it instead, in a fixed size that
+    does not grow with the vocabulary either.
+    """
+
+    def __init__(
+        self, lang: str, categories: list[str], sketch: EmojiSketch | None = None
+    ) -> None:
+        self.lang = lang
+        self.categories = categories
+        self.rows = 0  # tweets read
+        self.tweets = 0  # tweets with at least one emoji
+        self.tokens = 0
+        self.chars = 0  # characters in tweets with emoji
+        self.doc_counts = np.zeros(0, dtype=np.int64)
+        self.token_counts = np.zeros(0, dtype=np.int64)
+        self.category_hits = np.zeros(len(categories), dtype=np.int64)
+        self.sketch = sketch
+
+    def update(self, table: EmojiTable, rows: int, chars: int, hits) -> None:
+        "adds one batch: its extracted table, rows read, characters and category hits"
+        if self.sketch is not None:
+            self.sketch.update(table)
+        else:
+            size = len(table.vocab)
+            self.doc_counts = _grow(self.doc_counts, size) + table.doc_counts()
+            self.token_counts = _grow(self.token_counts, size) + table.token_counts()
+        self.category_hits += hits
+        self.rows += rows
+        self.tweets += len(table)
+        self.tokens += table.num_tokens
+        self.chars += chars
+
+    def merge(self, other: "StreamStats") -> None:
+        """
+        adds the aggregates of another shard of the language, both read with
+        from_dict into the same vocabulary or both sketched with the same args
+        """
+        if self.categories != other.categories:
+            raise ValueError("Stats of different categories cannot merge")
+        if (self.sketch is None) != (other.sketch is None):
+            raise ValueError("Sketched and exact stats cannot merge")
+        if self.sketch is not None:
+            self.sketch.merge(other.sketch)
+        else:
+            size = max(len(self.doc_counts), len(other.doc_counts))
+            self.doc_counts = _grow(self.doc_counts, size) + _grow(
+                other.doc_counts, size
+            )
+            self.token_counts = _grow(self.token_counts, size) + _grow(
+                other.token_counts, size
+            )
+        self.category_hits += other.category_hits
+        for key in ("rows", "tweets", "tokens", "chars"):
+            setattr(self, key, getattr(self, key) + getattr(other, key))
+
+    def to_dict(self, vocab: Vocabulary) -> dict:
+        if self.sketch is not None:
+            return self._sketch_dict()
+        types = int(np.count_nonzero(self.token_counts))
+        return {
+            "lang": self.lang,
+            "rows": self.rows,
+            "tweets": self.tweets,
+            "tokens": self.tokens,
+            "chars": self.chars,
+            "types": types,
+            "percent_with_emoji": self.tweets / max(self.rows, 1),
+            "type_token_ratio": types / max(self.tokens, 1),
+            "emoji_per_character": self.tokens / max(self.chars, 1),
+            "categories": dict(zip(self.categories, self.category_hits.tolist())),
+            "doc_counts": {
+                vocab[e]: int(self.doc_counts[e])
+                for e in np.flatnonzero(self.doc_counts)
+            },
+            "token_counts": {
+                vocab[e]: int(self.token_counts[e])
+                for e in np.flatnonzero(self.token_counts)
+            },
+        }
+
+    def _sketch_dict(self) -> dict:
+        "to_dict of a sketched language, doc_counts being the estimated heavy emoji"
+        types = self.sketch.num_types()
+        return {
+            "lang": self.lang,
+            "rows": self.rows,
+            "tweets": self.tweets,
+            "tokens": self.tokens,
+            "chars": self.chars,
+            "types": types,
+            "percent_with_emoji": self.tweets / max(self.rows, 1),
+            "type_token_ratio": types / max(self.tokens, 1),
+            "emoji_per_character": self.tokens / max(self.chars, 1),
+            "categories": dict(zip(self.categories, self.category_hits.tolist())),
+            "doc_counts": dict(self.sketch.top(self.sketch.args["capacity"])),
+            "sketch": self.sketch.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict, vocab: Vocabulary) -> "StreamStats":
+        stats = cls(d["lang"], list(d["categories"]))
+        for key in ("rows", "tweets", "tokens", "chars"):
+            setattr(stats, key, d[key])
+        stats.category_hits = np.array(list(d["categories"].values()), dtype=np.int64)
+        if "sketch" in d:
+            stats.sketch = EmojiSketch.from_dict(d["sketch"])
+            return stats
+        for key in ("doc_counts", "token_counts"):
+            counts = np.zeros(len(vocab), dtype=np.int64)
+            for e, count in d[key].items():
+                counts[vocab.intern(e)] = count
+            setattr(stats, key, counts)
+        return stats
+
+
+def merge_stats(files: list[str], vocab: Vocabulary) -> StreamStats:
+    "the stats.json checkpoints of shards of one language, merged into one"
+    merged = None
+    for file in files:
+        with open(file, "r", encoding="utf-8") as f:
+            stats = StreamStats.from_dict(json.load(f), vocab)
+        if merged is None:
+            merged = stats
+        else:
+            merged.merge(stats)
+    return merged
+
+
+def batches(source: str, batch_rows: int, skip=0, limit=None):
+    "yields (start, texts) from a save_to_disk directory or a Hugging Face dataset"
+    if os.path.isdir(source):
+        from datasets import load_from_disk
+
+        # arrow slices of a memory-mapped dataset, only the batch is materialized
+        dataset = load_from_disk(source).with_format("arrow")
+        total = len(dataset) if limit is None else min(len(dataset), limit)
+        for start in range(skip, total, batch_rows):
+            batch = dataset[start : min(start + batch_rows, total)]
+            yield start, batch.column("text").to_pylist()
+    else:
+        from datasets import load_dataset
+
+        dataset = load_dataset(source, split="train", streaming=True).skip(skip)
+        start = skip
+        for batch in dataset.iter(batch_size=batch_rows):
+            texts = batch["text"]
+            if limit is not None:
+                texts = texts[: max(limit - start, 0)]
+            if not texts:
+                return
+            yield start, texts
+            start += len(texts)
+
+
+def stream_language(
+    lang: str,
+    source: str,
+    out_dir="stream",
+    batch_mb=64,
+    categories=None,
+    workers=1,
+    limit=None,
+    sketch=None,
+) -> StreamStats:
+    """
+    Extracts emoji from source batch by batch, writing each batch's CSR arrays
+    to <out_dir>/<lang>/part_<start>.npz and checkpointing the aggregates to
+    <out_dir>/<lang>/stats.json. Rerunning resumes after the last checkpoint.
+    sketch, an EmojiSketch, keeps approximate per-emoji counts instead of exact
+    ones; a resumed run keeps whichever the checkpoint has
+    """
+    if categories is None:
+        categories = emoji_categories.DEFAULT_CATEGORIES
+    lang_dir = os.path.join(out_dir, lang)
+    os.makedirs(lang_dir, exist_ok=True)
+    stats_file = os.path.join(lang_dir, "stats.json")
+
+    vocab = Vocabulary(emoji_cache.load_vocab(out_dir))
+    names = NameTable(vocab)
+    try:
+        with open(stats_file, "r", encoding="utf-8") as f:
+            stats = StreamStats.from_dict(json.load(f), vocab)
+        print(f"Resuming {lang} after {stats.rows} tweets")
+    except FileNotFoundError:
+        stats = StreamStats(lang, list(categories), sketch)
+
+    batch_rows = max(1, batch_mb * 2**20 // BYTES_PER_TWEET)
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    matrix = np.zeros((0, len(categories)), dtype=bool)
+    try:
+        for start, texts in batches(source, batch_rows, stats.rows, limit):
+            if pool:
+                shard = -(-len(texts) // workers)
+                starts = range(0, len(texts), shard)
+                shards = [texts[s : s + shard] for s in starts]
+                rows = []
+                for chunk in pool.map(
+                    _extract_chunk, shards, [start + s for s in starts]
+                ):
+                    rows.extend(chunk)
+            else:
+                rows = _extract_chunk(texts, start)
+
+            table = EmojiTable.from_rows(rows, vocab)
+            if len(matrix) < len(vocab):
+                matrix = emoji_categories.lookup_matrix(names, categories)
+            hits = emoji_categories.membership(table, matrix).sum(axis=0)
+            chars = sum(len(texts[idx - start]) for _, idx in rows)
+            stats.update(table, len(texts), chars, hits)
+
+            np.savez(
+                os.path.join(lang_dir, f"part_{start:012d}.npz"),
+                ids=table.ids,
+                offsets=table.offsets,
+                indices=table.indices,
+            )
+            # stats.json last: it is the checkpoint a rerun resumes from
+            emoji_cache.write_json(
+                os.path.join(out_dir, emoji_cache.VOCAB_FILE), vocab.emojis
+            )
+            emoji_cache.write_json(stats_file, stats.to_dict(vocab))
+            print(f"{lang}: {stats.rows} tweets, {stats.tweets} with emoji")
+    finally:
+        if pool:
+            pool.shutdown()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Extract emoji and aggregate statistics in bounded memory"
+    )
+    parser.add_argument("lang")
+    parser.add_argument("source", help="save_to_disk directory or dataset id")
+    parser.add_argument("--out", default="stream")
+    parser.add_argument("--batch-mb", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument(
+        "--sketch",
+        action="store_true",
+        help="approximate per-emoji counts in fixed memory, mergeable across runs",
+    )
+    parser.add_argument("--capacity", type=int, default=1024, help="emoji kept exact")
+    parser.add_argument("--epsilon", type=float, default=0.001)
+    args = parser.parse_args()
+    sketch = None
+    if args.sketch:
+        sketch = EmojiSketch(capacity=args.capacity, epsilon=args.epsilon)
+    stream_language(
+        args.lang,
+        args.source,
+        out_dir=args.out,
+        batch_mb=args.batch_mb,
+        workers=args.workers,
+        limit=args.limit,
+        sketch=sketch,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,116 @@
-from datasets import load_dataset
-import emoji
+from datasets import Dataset
+import numpy as np
+import os
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from datetime import datetime
+
+from arrow_text import to_date32
+from emoji_tokenizer import tokenize
+
+
+def _date_bound(column: pa.ChunkedArray, min_date: str) -> pa.Scalar:
+    "min_date as a scalar comparable with column, which is either strings or timestamps"
+    if pa.types.is_timestamp(column.type):
+        # "2018" -> 2018-01-01, "2018-06" -> 2018-06-01
+        bound = datetime.fromisoformat(min_date + "-01-01"[len(min_date) - 4 :])
+        return pa.scalar(bound, type=column.type)
+    return pa.scalar(min_date)
+
+
+def keep_rows(batch: pa.Table, min_date="2018", require_emoji=True) -> np.ndarray:
+    "mask of rows dated on or after min_date whose text contains an emoji"
+    if min_date is None:
+        recent = np.ones(len(batch), dtype=bool)
+    else:
+        date = batch["date"]
+        recent = pc.greater_equal(date, _date_bound(date, min_date))
+        recent = pc.fill_null(recent, False).to_numpy(zero_copy_only=False)
+    if not require_emoji:
+        return recent
+
+    # the date test is cheap, so only recent rows get the emoji check.
+    # tokenize() rejects text without emoji-block codepoints before any parsing
+    # and otherwise matches emoji.analyze, i.e. emoji.emoji_count(text) > 0
+    candidates = np.flatnonzero(recent)
+    texts = batch["text"].take(candidates).to_pylist()
+    keep = np.zeros(len(batch), dtype=bool)
+    keep[candidates] = [text is not None and bool(tokenize(text)) for text in texts]
+    return keep
+
+
+def filter_dataset(
+    dataset: Dataset, min_date="2018", num_proc=None, require_emoji=True
+) -> Dataset:
+    "batched, multi-process filter of the whole dataset with keep_rows"
+    return (
+        dataset.with_format("arrow")
+        .filter(
+            keep_rows,
+            batched=True,
+            batch_size=10000,
+            num_proc=num_proc,
+            fn_kwargs={"min_date": min_date, "require_emoji": require_emoji},
+        )
+        .with_format(None)
+    )
+
+
+def compact_table(table: pa.Table) -> pa.Table:
+    "the text and, if there is one, the date as 4-byte days since 1970"
+    if "date" not in table.column_names:
+        return table.select(["text"])
+    return pa.table({"text": table["text"], "date": to_date32(table["date"])})
+
+
+def compact_dates(dataset: Dataset, num_proc=None) -> Dataset:
+    "compact_table over a dataset, converting only if the date is not days yet"
+    columns = [c for c in ("text", "date") if c in dataset.column_names]
+    dataset = dataset.select_columns(columns)
+    if "date" not in columns or dataset.features["date"].dtype == "date32":
+        return dataset
+    return (
+        dataset.with_format("arrow")
+        .map(compact_table, batched=True, batch_size=10000, num_proc=num_proc)
+        .with_format(None)
+    )
+
+
+def sample_early_exit(
+    file: str, size: int, min_date="2018", seed=497, rename=None, require_emoji=True
+) -> Dataset:
+    """
+    Reads parquet row groups in a seeded random order, filtering each one, and
+    stops as soon as size qualifying rows are in hand. Those rows are then
+    subsampled and shuffled with the same seed. Rows within a row group stay
+    correlated (e.g. by date), so this trades a little randomness for reading
+    only the fraction of the file that is needed.
+    """
+    rng = np.random.default_rng(seed)
+    parquet = pq.ParquetFile(file)
+    kept = []
+    found = 0
+    for group in rng.permutation(parquet.num_row_groups):
+        batch = parquet.read_row_group(int(group))
+        if rename:
+            batch = batch.rename_columns([rename.get(c, c) for c in batch.column_names])
+        batch = batch.filter(keep_rows(batch, min_date, require_emoji))
+        kept.append(compact_table(batch))
+        found += len(batch)
+        if found >= size:
+            break
+
+    table = pa.concat_tables(kept)
+    rows = rng.choice(len(table), size=min(size, len(table)), replace=False)
+    return Dataset(table.take(rows))
 
 
 def main():
-    langs = ["it"]  # CHANGE THIS ONE
-    data_ids = ["local"]
-    # NOTE:
-    filter = True
-
-    data_ids = {lang: id for lang, id in zip(langs, data_ids)}
-    lang_data = {}
-
-    for lang in langs:
-        if data_ids[lang] == "local":
-            lang_data[lang] = load_dataset(
-                "parquet", data_files={"train": "it_data/train.parquet"}
-            )["train"]
-        else:
-            lang_data[lang] = load_dataset(data_ids[lang], split="train")
-
-        if lang == "it":
-            lang_data[lang] = lang_data[lang].rename_column("created_at", "date")
-
-        if filter:
-            lang_data[lang] = lang_data[lang].filter(
-                lambda x: x["date"] >= "2018" and emoji.emoji_count(x["text"]) > 0,
-                batched=False,
-            )
-
-        # remove unnecessary columns
-        lang_data[lang] = lang_data[lang].select_columns(["text"])
-
-        # filter for tweets in or after 2022
-        if filter:
-            lang_data[lang] = lang_data[lang].shuffle(seed=497)
-            lang_data[lang] = lang_data[lang].select(range(500000))
-            print(len(lang_data[lang]))
-            if lang == "en":
-                lang_data[lang].save_to_disk("../en_data")
-            elif lang == "it":
-                lang_data[lang].save_to_disk("../it_data")
+    # languages, sources and sizes are in ingest.json now, see ingest.py
+    import ingest
+
+    ingest.ingest(ingest.load_config(), langs=["it"], num_proc=os.cpu_count())
 
 
 if __name__ == "__main__":